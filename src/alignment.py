@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .cues import Cue
+
+# Separates the text of different native-language tracks in a translation
+TRACK_SEPARATOR = "<br>"
+
+
+def pair_track(subs: Sequence[Cue], track: Sequence[Cue]) -> Dict[int, List[Cue]]:
+    """Assign each cue of a translation track to the first target cue covering
+    more than a quarter of it, sweeping both tracks in start order at once.
+
+    Returns the translation cues assigned to each target cue that got any,
+    in track order.
+    """
+    order = sorted(range(len(subs)), key=lambda i: (subs[i][0], i))
+    starts = [subs[i][0] for i in order]
+    ends = [subs[i][1] for i in order]
+    max_ends: List[float] = list(accumulate(ends, max))
+
+    assigned: List[Optional[int]] = [None] * len(track)
+    lo = 0
+    for track_idx in sorted(range(len(track)), key=lambda j: (track[j][0], j)):
+        tr_start, tr_end, _ = track[track_idx]
+        if tr_end <= tr_start:
+            continue
+        # Target cues left behind here are over before any later translation cue starts
+        while lo < len(starts) and max_ends[lo] <= tr_start:
+            lo += 1
+        pos = lo
+        while pos < len(starts) and starts[pos] < tr_end:
+            if ends[pos] > tr_start:
+                overlap = min(ends[pos], tr_end) - max(starts[pos], tr_start)
+                if overlap / (tr_end - tr_start) > 0.25:
+                    sub_id = order[pos]
+                    if assigned[track_idx] is None or sub_id < assigned[track_idx]:
+                        assigned[track_idx] = sub_id
+            pos += 1
+
+    groups: Dict[int, List[Cue]] = {}
+    for track_idx, sub_id in enumerate(assigned):
+        if sub_id is not None:
+            groups.setdefault(sub_id, []).append(track[track_idx])
+    return groups
+
+
+def join_tracks(subs: Sequence[Cue], tracks: Sequence[Sequence[Cue]]) -> List[Cue]:
+    """Build one translation cue per target cue from all the native-language tracks."""
+    track_groups = [pair_track(subs, track) for track in tracks]
+    translations = []
+    for sub_id, (sub_start, sub_end, _) in enumerate(subs):
+        groups = [groups[sub_id] for groups in track_groups if sub_id in groups]
+        if not groups:
+            translations.append((sub_start, sub_end, ""))
+            continue
+        translations.append(
+            (
+                min(group[0][0] for group in groups),
+                max(group[-1][1] for group in groups),
+                TRACK_SEPARATOR.join(
+                    " ".join(cue[2] for cue in group) for group in groups
+                ),
+            )
+        )
+    return translations
+
+
+def merge_untranslated(
+    subs: Sequence[Cue], translations: Sequence[Cue]
+) -> Tuple[List[Cue], List[Cue]]:
+    """Merge target cues without a translation into the neighbour they belong to."""
+    merged_subs: List[Cue] = []
+    merged_translations: List[Cue] = []
+    # A cue merged forward replaces the next one before it's looked at
+    carry: Optional[Cue] = None
+    last = len(subs) - 1
+    for idx, translation in enumerate(translations):
+        sub = carry if carry is not None else subs[idx]
+        carry = None
+        if translation[2] != "" or len(merged_subs) + len(subs) - idx <= 1:
+            merged_subs.append(sub)
+            merged_translations.append(translation)
+            continue
+
+        sub_start, sub_end, sub_text = sub
+        has_prev = len(merged_subs) > 0
+        prev_tr_end = merged_translations[-1][1] if has_prev else 0.0
+        next_tr_start = translations[idx + 1][0] if idx < last else 0.0
+
+        if idx == last or (sub_end <= next_tr_start and has_prev):
+            merge_back = True
+        elif sub_start >= next_tr_start or sub_start >= prev_tr_end:
+            merge_back = False
+        else:
+            merge_back = (prev_tr_end - sub_start) > (
+                sub_end - next_tr_start
+            ) and has_prev
+
+        if merge_back:
+            prev_start, _, prev_text = merged_subs[-1]
+            merged_subs[-1] = (prev_start, sub_end, prev_text + " " + sub_text)
+        else:
+            _, next_end, next_text = subs[idx + 1]
+            carry = (sub_start, next_end, sub_text + " " + next_text)
+
+    return merged_subs, merged_translations
+
+
+def align_subtitles(
+    subs: Sequence[Cue], tracks: Sequence[Sequence[Cue]]
+) -> Tuple[List[Cue], List[Cue]]:
+    """Pair target-language cues with one or more native-language tracks in linear time.
+
+    Returns the (possibly merged) target cues and their translations.
+    """
+    return merge_untranslated(subs, join_tracks(subs, tracks))
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import tempfile
+import time
+from typing import Callable, List, Optional, Tuple
+
+from .ffmpeg import popen_options
+from .subs_sync import np
+
+# Mono 16-bit PCM at this rate keeps speech clear at 48 KB a second
+SAMPLE_RATE = 24000
+
+# Length of the fade in and out of clips, in seconds, like the encoded ones
+FADE = 0.25
+
+# Decoded tracks kept at once; the current file's and the previous one's
+MAX_FILES = 2
+
+# Temporary files not written to for this long, in seconds, are of decodes
+# that were cut short, e.g. by Anki crashing
+STALE_TEMP_AGE = 10 * 60
+
+
+def decode_pcm(
+    ffmpeg: str,
+    path: str,
+    audio_index: int,
+    pcm_path: str,
+    cancelled: Callable[[], bool] = lambda: False,
+) -> bool:
+    """Decode an audio track to a raw mono PCM file.
+
+    Sample 0 is at time 0 of the player, and the file only appears at
+    pcm_path once it's complete.
+    """
+    argv = [ffmpeg, "-hide_banner", "-nostdin", "-v", "error", "-i", path]
+    argv += ["-map", "0:a:%d" % audio_index, "-vn", "-sn", "-dn"]
+    argv += ["-af", "aresample=first_pts=0", "-ac", "1", "-ar", str(SAMPLE_RATE)]
+    argv += ["-f", "s16le", "-"]
+    try:
+        os.makedirs(os.path.dirname(pcm_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(pcm_path), suffix=".tmp")
+    except OSError:
+        return False
+    try:
+        process = subprocess.Popen(
+            argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **popen_options()
+        )
+    except OSError:
+        os.close(fd)
+        os.remove(tmp_path)
+        return False
+
+    ok = False
+    try:
+        with process, os.fdopen(fd, "wb") as file:
+            while True:
+                data = process.stdout.read(1 << 20)
+                if not data:
+                    break
+                if cancelled():
+                    process.kill()
+                    break
+                file.write(data)
+        ok = process.returncode == 0 and not cancelled()
+        if ok:
+            os.replace(tmp_path, pcm_path)
+    except OSError:
+        ok = False
+    if not ok:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return ok
+
+
+def load_pcm(pcm_path: str) -> Optional["np.ndarray"]:
+    """Map a decoded track into memory, so only the samples that are cut are read."""
+    try:
+        pcm = np.memmap(pcm_path, dtype="<i2", mode="r")
+        # Keep the recently used tracks when pruning
+        os.utime(pcm_path)
+    except (OSError, ValueError):
+        return None
+    return pcm
+
+
+def prune(directory: str, keep: int = MAX_FILES) -> None:
+    """Remove all but the `keep` most recently used decoded tracks.
+
+    Temporary files of decodes that were cut short are removed too, and if no
+    track is kept, those of decodes still running as well.
+    """
+    files: List[Tuple[float, str]] = []
+    stale: List[str] = []
+    now = time.time()
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith(".pcm"):
+                    files.append((entry.stat().st_mtime, entry.path))
+                elif entry.name.endswith(".tmp"):
+                    if keep == 0 or now - entry.stat().st_mtime > STALE_TEMP_AGE:
+                        stale.append(entry.path)
+    except OSError:
+        return
+    for path in stale + [path for _, path in sorted(files, reverse=True)[keep:]]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cut_clip(pcm: "np.ndarray", start: float, end: float) -> Optional[bytes]:
+    """Return the faded PCM of the clip between start and end.
+
+    Parts of the clip outside of the track are silent. Returns None if the
+    clip doesn't overlap the track.
+    """
+    first = int(round(start * SAMPLE_RATE))
+    last = int(round(end * SAMPLE_RATE))
+    if last <= max(first, 0) or first >= len(pcm):
+        return None
+    clip = np.zeros(last - first, dtype=np.float32)
+    lo, hi = max(first, 0), min(last, len(pcm))
+    clip[lo - first : hi - first] = pcm[lo:hi]
+    fade = min(int(FADE * SAMPLE_RATE), len(clip) // 2)
+    if fade > 0:
+        ramp = np.linspace(0.0, 1.0, fade, endpoint=False, dtype=np.float32)
+        clip[:fade] *= ramp
+        clip[-fade:] *= ramp[::-1]
+    return clip.astype("<i2").tobytes()
+
+
+def encode_argv(ffmpeg: str, output: str) -> List[str]:
+    """Build the command that encodes PCM from cut_clip(), given on its stdin."""
+    argv = [ffmpeg, "-y", "-hide_banner", "-nostdin", "-v", "error"]
+    argv += ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "-"]
+    return argv + [output]
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import tempfile
+from typing import Callable, Optional, Sequence
+
+from .ffmpeg import popen_options
+from .subs_sync import MIN_IMPROVEMENT, activity, np, peak
+
+# Width of a frame of the audio envelope, in seconds
+ENVELOPE_RESOLUTION = 0.05
+
+# Speech doesn't need more to be told apart from silence
+SAMPLE_RATE = 8000
+
+# Subtitles further off than this are most likely for another cut of the video
+MAX_DELAY = 120.0
+
+# Smaller delays aren't worth changing the subtitle delay for
+MIN_DELAY = 0.1
+
+# Frames up to this fraction of the level range of a window above its quietest
+# frame count as silence when snapping clip boundaries
+QUIET_TOLERANCE = 0.1
+
+
+def decode_envelope(
+    ffmpeg: str,
+    path: str,
+    audio_index: int,
+    cancelled: Callable[[], bool] = lambda: False,
+) -> Optional["np.ndarray"]:
+    """Return the RMS level of the speech band of an audio track, one value per frame.
+
+    The audio is decoded to low sample rate PCM and reduced as it's read, so
+    a whole movie is never held in memory.
+    """
+    frame = int(SAMPLE_RATE * ENVELOPE_RESOLUTION)
+    chunk_size = frame * 2 * 4096
+    # Start the PCM at time 0 of the container like the player does, dropping
+    # encoder priming and padding late-starting tracks with silence
+    argv = [ffmpeg, "-hide_banner", "-nostdin", "-v", "error", "-copyts"]
+    argv += ["-i", path, "-map", "0:a:%d" % audio_index, "-vn", "-sn", "-dn"]
+    argv += ["-af", "aresample=first_pts=0,highpass=f=200,lowpass=f=3000"]
+    argv += ["-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"]
+    try:
+        process = subprocess.Popen(
+            argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **popen_options()
+        )
+    except OSError:
+        return None
+
+    levels = []
+    rest = b""
+    with process:
+        while True:
+            data = process.stdout.read(chunk_size)
+            if not data:
+                break
+            if cancelled():
+                process.kill()
+                return None
+            data = rest + data
+            usable = len(data) - len(data) % (frame * 2)
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32)
+            levels.append(np.sqrt(np.mean(samples.reshape(-1, frame) ** 2, axis=1)))
+            rest = data[usable:]
+    if process.returncode != 0 or not levels:
+        return None
+    return np.concatenate(levels)
+
+
+def load_envelope(path: str) -> Optional["np.ndarray"]:
+    """Map a saved envelope into memory, so only the frames that are used are read."""
+    try:
+        return np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+
+def save_envelope(path: str, envelope: "np.ndarray") -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, envelope)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def estimate_delay(
+    envelope: "np.ndarray", starts: Sequence[float], ends: Sequence[float]
+) -> Optional[float]:
+    """Estimate the subtitle delay that lines up cues with the speech in an envelope.
+
+    Returns None if the subtitles already match the audio or no delay clearly does.
+    """
+    if len(envelope) == 0 or len(starts) == 0:
+        return None
+    level = np.log10(envelope + 1.0)
+    # Louder than the typical level of the track is taken to be speech
+    speech = (level > np.median(level)).astype(np.float32)
+    subs = activity(
+        np.asarray(starts, dtype=np.float64),
+        np.asarray(ends, dtype=np.float64),
+        len(speech),
+        ENVELOPE_RESOLUTION,
+    )
+    speech -= speech.mean()
+    subs -= subs.mean()
+    size = 1 << (2 * len(speech) - 1).bit_length()
+    # corr[k] is the agreement with the subtitles delayed by k frames
+    corr = np.fft.irfft(
+        np.fft.rfft(speech, size) * np.conj(np.fft.rfft(subs, size)), size
+    )
+    max_lag = min(int(MAX_DELAY / ENVELOPE_RESOLUTION), len(speech) - 1)
+    lags = np.concatenate((corr[size - max_lag :], corr[: max_lag + 1]))
+    pos, score = peak(lags)
+    delay = (pos - max_lag) * ENVELOPE_RESOLUTION
+    unshifted = float(corr[0])
+    if score <= 0 or (unshifted > 0 and score < unshifted * MIN_IMPROVEMENT):
+        return None
+    if abs(delay) < MIN_DELAY:
+        return None
+    return delay
+
+
+def snap_to_silence(
+    envelope: "np.ndarray", start: float, end: float, toward: float
+) -> Optional[float]:
+    """Return the quiet point between start and end that's nearest to `toward`.
+
+    Returns None if the range isn't covered by the envelope.
+    """
+    first = max(int(start / ENVELOPE_RESOLUTION), 0)
+    last = min(int(end / ENVELOPE_RESOLUTION) + 1, len(envelope))
+    if first >= last:
+        return None
+    window = np.asarray(envelope[first:last])
+    low = window.min()
+    quiet = np.flatnonzero(window <= low + QUIET_TOLERANCE * (window.max() - low))
+    times = (first + quiet + 0.5) * ENVELOPE_RESOLUTION
+    time = float(times[np.argmin(np.abs(times - toward))])
+    return min(max(time, start), end)
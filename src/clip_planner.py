@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+from typing import List, NamedTuple, Sequence, Tuple
+
+from .media_index import MediaOutput, temp_path
+from .media_jobs import (
+    PRIORITY_AUDIO,
+    PRIORITY_IMAGE,
+    PRIORITY_VIDEO,
+    PRIORITY_VP9,
+    MediaJob,
+)
+
+# Length of the fade in and out of clips' audio, in seconds
+FADE = 0.25
+
+# How far past the keyframe clips cut without re-encoding are seeked to, in seconds
+COPY_SEEK_MARGIN = 0.2
+
+# Images are the first frame of this long a range, so there is one to take
+IMAGE_WINDOW = 0.5
+
+# Clips of many cards are cut in windows of the source of at most this many
+# seconds, and this many outputs, each decoded once from a single seek
+MAX_WINDOW = 60.0
+MAX_OUTPUTS = 24
+
+VP9_OPTIONS = ["-c:v", "libvpx-vp9", "-b:v", "1400K", "-crf", "23"]
+
+
+class Clip(NamedTuple):
+    start: float
+    end: float
+    path: str
+    video: bool = False
+    # Key of the media index the output is recorded with
+    key: str = ""
+    # Video clips starting at a keyframe can be cut without re-encoding
+    copy: bool = False
+    # Images only take the first frame of the clip, scaled to the image size
+    image: bool = False
+    # Options of the video encoder that depend on the machine, see encoder_tuning
+    options: Tuple[str, ...] = ()
+
+    @property
+    def is_vp9(self) -> bool:
+        return self.video and self.path.endswith(".webm")
+
+
+def clip_argv(
+    ffmpeg: str,
+    source: str,
+    clips: Sequence[Clip],
+    audio_index: int,
+    video_size: Tuple[int, int],
+    image_size: Tuple[int, int] = (-2, -2),
+) -> List[str]:
+    """Build one ffmpeg command that cuts all clips from a single decode of the window they span.
+
+    Video is scaled once for the video clips and once for the images, and
+    split between them, and the audio is split between all clips but the
+    images, each trimmed to its own range.
+    """
+    start = min(clip.start for clip in clips)
+    end = max(clip.end for clip in clips)
+    argv = [ffmpeg, "-y", "-ss", "%.3f" % start, "-t", "%.3f" % (end - start)]
+    argv += ["-i", source]
+
+    video_count = sum(clip.video for clip in clips)
+    image_count = sum(clip.image for clip in clips)
+    audio_count = len(clips) - image_count
+    graph = []
+    video_input = image_input = "[0:v:0]"
+    if video_count and image_count:
+        graph.append("[0:v:0]split=2[vsrc][isrc]")
+        video_input, image_input = "[vsrc]", "[isrc]"
+    for label, pad, size, count in (
+        ("v", video_input, video_size, video_count),
+        ("i", image_input, image_size, image_count),
+    ):
+        if count:
+            graph.append(
+                "%sscale=%d:%d,split=%d%s"
+                % (
+                    pad,
+                    *size,
+                    count,
+                    "".join("[%s%d]" % (label, i) for i in range(count)),
+                )
+            )
+    if audio_count:
+        graph.append(
+            "[0:a:%d]asplit=%d%s"
+            % (
+                audio_index,
+                audio_count,
+                "".join("[a%d]" % i for i in range(audio_count)),
+            )
+        )
+
+    outputs: List[str] = []
+    video_idx = image_idx = audio_idx = 0
+    for idx, clip in enumerate(clips):
+        clip_start = clip.start - start
+        clip_end = clip.end - start
+        if clip.image:
+            graph.append(
+                "[i%d]trim=start=%.3f:end=%.3f,setpts=PTS-STARTPTS[iout%d]"
+                % (image_idx, clip_start, clip_end, idx)
+            )
+            outputs += ["-map", "[iout%d]" % idx, "-frames:v", "1", "-update", "1"]
+            outputs += [clip.path]
+            image_idx += 1
+            continue
+        if clip.video:
+            graph.append(
+                "[v%d]trim=start=%.3f:end=%.3f,setpts=PTS-STARTPTS[vout%d]"
+                % (video_idx, clip_start, clip_end, idx)
+            )
+            outputs += ["-map", "[vout%d]" % idx]
+            video_idx += 1
+        graph.append(
+            "[a%d]atrim=start=%.3f:end=%.3f,asetpts=PTS-STARTPTS,"
+            "afade=t=in:st=0:d=%.3f,afade=t=out:st=%.3f:d=%.3f[aout%d]"
+            % (
+                audio_idx,
+                clip_start,
+                clip_end,
+                FADE,
+                clip_end - clip_start - FADE,
+                FADE,
+                idx,
+            )
+        )
+        outputs += ["-map", "[aout%d]" % idx]
+        audio_idx += 1
+        if clip.is_vp9:
+            outputs += VP9_OPTIONS
+        if clip.video:
+            outputs += clip.options
+        outputs += [clip.path]
+
+    argv += ["-filter_complex", ";".join(graph)]
+    return argv + outputs
+
+
+def copy_argv(ffmpeg: str, source: str, clip: Clip, audio_index: int) -> List[str]:
+    """Build an ffmpeg command that cuts a video clip without re-encoding the video.
+
+    The clip has to start at a keyframe. Only the audio is decoded, to fade it.
+    """
+    duration = clip.end - clip.start
+    # Seeking lands up to 3/23s early for streams with B-frames, so the video is
+    # seeked past the keyframe and shifted back; copying starts at the keyframe
+    argv = [ffmpeg, "-y", "-itsoffset", "%.3f" % COPY_SEEK_MARGIN]
+    argv += ["-ss", "%.3f" % (clip.start + COPY_SEEK_MARGIN), "-i", source]
+    argv += ["-ss", "%.3f" % clip.start, "-i", source]
+    argv += ["-map", "0:v:0", "-map", "1:a:%d" % audio_index, "-c:v", "copy"]
+    argv += [
+        "-af",
+        "afade=t=in:st=0:d=%.3f,afade=t=out:st=%.3f:d=%.3f"
+        % (FADE, duration - FADE, FADE),
+    ]
+    argv += ["-t", "%.3f" % duration]
+    return argv + [clip.path]
+
+
+def plan_clips(
+    ffmpeg: str,
+    source: str,
+    clips: Sequence[Clip],
+    audio_index: int,
+    video_size: Tuple[int, int],
+    image_size: Tuple[int, int] = (-2, -2),
+) -> List[MediaJob]:
+    """Turn the clips of one or more cards into as few ffmpeg jobs as possible.
+
+    All video clips that are encoded share one decode of the source. Audio-only
+    clips get their own job, which only decodes audio and so can run ahead of
+    the video, and so do images and each clip whose video is copied. Clips
+    spread over more of the source than a window are cut window by window, in
+    order, so the source is still only read once.
+    """
+    jobs = []
+    image_clips = [clip for clip in clips if clip.image]
+    audio_clips = [clip for clip in clips if not clip.video and not clip.image]
+    video_clips = [clip for clip in clips if clip.video and not clip.copy]
+    for clip in clips:
+        if clip.video and clip.copy:
+            output = MediaOutput(temp_path(clip.path), clip.path, clip.key)
+            argv = copy_argv(
+                ffmpeg, source, clip._replace(path=output.temp_path), audio_index
+            )
+            jobs.append(MediaJob(PRIORITY_AUDIO, argv, [output]))
+    for window in _windows(image_clips):
+        jobs.append(
+            _clips_job(
+                PRIORITY_IMAGE,
+                ffmpeg,
+                source,
+                window,
+                audio_index,
+                video_size,
+                image_size,
+            )
+        )
+    for window in _windows(audio_clips):
+        jobs.append(
+            _clips_job(
+                PRIORITY_AUDIO,
+                ffmpeg,
+                source,
+                window,
+                audio_index,
+                video_size,
+                image_size,
+            )
+        )
+    for window in _windows(video_clips):
+        priority = (
+            PRIORITY_VP9 if any(clip.is_vp9 for clip in window) else PRIORITY_VIDEO
+        )
+        jobs.append(
+            _clips_job(
+                priority, ffmpeg, source, window, audio_index, video_size, image_size
+            )
+        )
+    return jobs
+
+
+def _windows(clips: Sequence[Clip]) -> List[List[Clip]]:
+    """Group clips by start into windows of at most MAX_WINDOW seconds and MAX_OUTPUTS clips.
+
+    A clip longer than a window gets one of its own.
+    """
+    windows: List[List[Clip]] = []
+    for clip in sorted(clips, key=lambda clip: (clip.start, clip.end)):
+        if (
+            windows
+            and len(windows[-1]) < MAX_OUTPUTS
+            and clip.end - windows[-1][0].start <= MAX_WINDOW
+        ):
+            windows[-1].append(clip)
+        else:
+            windows.append([clip])
+    return windows
+
+
+def _clips_job(
+    priority: int,
+    ffmpeg: str,
+    source: str,
+    clips: Sequence[Clip],
+    audio_index: int,
+    video_size: Tuple[int, int],
+    image_size: Tuple[int, int],
+) -> MediaJob:
+    outputs = [MediaOutput(temp_path(clip.path), clip.path, clip.key) for clip in clips]
+    temp_clips = [
+        clip._replace(path=output.temp_path) for clip, output in zip(clips, outputs)
+    ]
+    argv = clip_argv(ffmpeg, source, temp_clips, audio_index, video_size, image_size)
+    return MediaJob(priority, argv, outputs)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .timeline import SubtitleTimeline
+
+Cue = Tuple[float, float, str]
+
+
+class CueStore:
+    """Column-oriented storage of subtitle cues and their translations.
+
+    Times are kept in flat arrays of doubles and texts in a table shared by
+    both tracks, so repeated lines (and the empty translations of untranslated
+    cues) are stored once. Cue tuples are only built when a cue is accessed.
+    """
+
+    __slots__ = (
+        "starts",
+        "ends",
+        "_text_ids",
+        "_tr_starts",
+        "_tr_ends",
+        "_tr_text_ids",
+        "_texts",
+    )
+
+    def __init__(
+        self, subs: Sequence[Cue] = (), translations: Sequence[Cue] = ()
+    ) -> None:
+        self._texts: List[str] = []
+        text_ids: Dict[str, int] = {}
+
+        def intern(text: str) -> int:
+            text_id = text_ids.get(text)
+            if text_id is None:
+                text_id = text_ids[text] = len(self._texts)
+                self._texts.append(text)
+            return text_id
+
+        self.starts = array("d", (cue[0] for cue in subs))
+        self.ends = array("d", (cue[1] for cue in subs))
+        self._text_ids = array("I", (intern(cue[2]) for cue in subs))
+        # Translations are aligned with the cues, so they share their index
+        self._tr_starts = array("d", (cue[0] for cue in translations))
+        self._tr_ends = array("d", (cue[1] for cue in translations))
+        self._tr_text_ids = array("I", (intern(cue[2]) for cue in translations))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Cue]:
+        for idx in range(len(self.starts)):
+            yield self.cue(idx)
+
+    @property
+    def has_translations(self) -> bool:
+        return len(self._tr_text_ids) != 0
+
+    def cue(self, idx: int) -> Cue:
+        return (self.starts[idx], self.ends[idx], self._texts[self._text_ids[idx]])
+
+    def translation(self, idx: int) -> Cue:
+        return (
+            self._tr_starts[idx],
+            self._tr_ends[idx],
+            self._texts[self._tr_text_ids[idx]],
+        )
+
+
+class FileSubtitles:
+    """The subtitles loaded for a media file."""
+
+    def __init__(
+        self,
+        filePath: str = "",
+        subsPath: Optional[str] = None,
+        translationsPaths: Sequence[str] = (),
+        cues: Optional[CueStore] = None,
+        status_code: str = "success",
+    ) -> None:
+        self.filePath = filePath
+        self.subsPath = subsPath
+        self.translationsPaths = list(translationsPaths)
+        self.cues = cues if cues is not None else CueStore()
+        self.timeline = SubtitleTimeline(self.cues.starts, self.cues.ends)
+        self.status_code = status_code
+
+    @property
+    def paths(self) -> List[str]:
+        """The subtitle files to show, target language first."""
+        return ([self.subsPath] if self.subsPath else []) + self.translationsPaths
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, List, NamedTuple
+
+
+class _Listing(NamedTuple):
+    mtime: int
+    names: List[str]
+    normalized: List[str]
+
+
+class DirectoryIndex:
+    """In-memory listings of directories, each read at most once until it changes.
+
+    A directory is only listed again when its mtime changes, which saves a full
+    listing for every lookup on slow (e.g. network-mounted) drives.
+    """
+
+    def __init__(self) -> None:
+        self._listings: Dict[str, _Listing] = {}
+
+    def _listing(self, directory: str) -> _Listing:
+        directory = directory or os.curdir
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return _Listing(0, [], [])
+        listing = self._listings.get(directory)
+        if listing is not None and listing.mtime == mtime:
+            return listing
+        try:
+            with os.scandir(directory) as it:
+                names = [entry.name for entry in it if entry.is_file()]
+        except OSError:
+            names = []
+        listing = _Listing(mtime, names, [os.path.normcase(name) for name in names])
+        self._listings[directory] = listing
+        return listing
+
+    def isfile(self, path: str) -> bool:
+        directory, name = os.path.split(path)
+        return os.path.normcase(name) in self._listing(directory).normalized
+
+    def find(self, path_prefix: str, infix: str, suffix: str) -> List[str]:
+        """Return the files matching `path_prefix*infix*suffix`, in listing order.
+
+        This matches what glob would return for the pattern, without any of
+        the parts being treated as wildcards.
+        """
+        directory, prefix = os.path.split(path_prefix)
+        prefix = os.path.normcase(prefix)
+        infix = os.path.normcase(infix)
+        suffix = os.path.normcase(suffix)
+        min_length = len(prefix) + len(infix) + len(suffix)
+        listing = self._listing(directory)
+        return [
+            os.path.join(directory, name)
+            for name, normalized in zip(listing.names, listing.normalized)
+            if len(normalized) >= min_length
+            and normalized.startswith(prefix)
+            and normalized.endswith(suffix)
+            and infix in normalized[len(prefix) : len(normalized) - len(suffix)]
+        ]
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from .ffmpeg import run
+
+# Subtitle codecs ffmpeg can convert to SRT; image-based ones (PGS, VobSub) can't be
+TEXT_CODECS = {"subrip", "srt", "ass", "ssa", "webvtt", "mov_text", "text"}
+
+# ISO 639-2 codes (bibliographic and terminology) used by containers for the
+# ISO 639-1 codes the add-on is configured with
+LANGUAGE_CODES = {
+    "ar": ("ara",),
+    "bg": ("bul",),
+    "cs": ("cze", "ces"),
+    "da": ("dan",),
+    "de": ("ger", "deu"),
+    "el": ("gre", "ell"),
+    "en": ("eng",),
+    "es": ("spa",),
+    "et": ("est",),
+    "fa": ("per", "fas"),
+    "fi": ("fin",),
+    "fr": ("fre", "fra"),
+    "he": ("heb",),
+    "hi": ("hin",),
+    "hr": ("hrv",),
+    "hu": ("hun",),
+    "id": ("ind",),
+    "it": ("ita",),
+    "ja": ("jpn",),
+    "ko": ("kor",),
+    "lt": ("lit",),
+    "lv": ("lav",),
+    "ms": ("may", "msa"),
+    "nl": ("dut", "nld"),
+    "no": ("nor", "nob", "nno"),
+    "pl": ("pol",),
+    "pt": ("por",),
+    "ro": ("rum", "ron"),
+    "ru": ("rus",),
+    "sk": ("slo", "slk"),
+    "sl": ("slv",),
+    "sr": ("srp",),
+    "sv": ("swe",),
+    "th": ("tha",),
+    "tr": ("tur",),
+    "uk": ("ukr",),
+    "vi": ("vie",),
+    "zh": ("chi", "zho"),
+}
+
+# e.g. "  Stream #0:3[0x1203](eng): Subtitle: subrip (srt) (default)"
+_STREAM_RE = re.compile(
+    r"^\s*Stream #\d+:(\d+)(?:\[\w+\])?(?:\((\w+)\))?: Subtitle: (\w+)", re.M
+)
+
+
+class SubtitleStream(NamedTuple):
+    ff_index: int
+    language: str
+    codec: str
+
+
+def matches_language(stream: SubtitleStream, code: str) -> bool:
+    language = stream.language.lower()
+    code = code.lower()
+    return language == code or language in LANGUAGE_CODES.get(code, ())
+
+
+def probe_subtitle_streams(ffmpeg: str, path: str) -> Optional[List[SubtitleStream]]:
+    """Return the text subtitle streams of a media file, or None if it can't be probed."""
+    try:
+        # Without an output file ffmpeg prints the streams and fails
+        result = run([ffmpeg, "-hide_banner", "-nostdin", "-i", path])
+    except OSError:
+        return None
+    output = result.stderr.decode("utf-8", errors="replace")
+    if "Input #0" not in output:
+        return None
+    return [
+        SubtitleStream(int(index), language or "", codec)
+        for index, language, codec in _STREAM_RE.findall(output)
+        if codec in TEXT_CODECS
+    ]
+
+
+def extract_subtitle_streams(ffmpeg: str, path: str, outputs: Dict[int, str]) -> bool:
+    """Convert the given streams of a media file to SRT files in one pass.
+
+    `outputs` maps stream indexes to output paths. Each file is either fully
+    written or not there at all.
+    """
+    # Keep the timestamps of the container, which are what the player shows
+    argv = [ffmpeg, "-hide_banner", "-nostdin", "-v", "error", "-y", "-copyts"]
+    argv += ["-i", path]
+    tmp_paths = {}
+    for index, out_path in outputs.items():
+        tmp_paths[out_path] = out_path + ".tmp"
+        argv += ["-map", "0:%d" % index, "-c:s", "srt", "-f", "srt", out_path + ".tmp"]
+    try:
+        os.makedirs(os.path.dirname(next(iter(outputs.values()))), exist_ok=True)
+        result = run(argv)
+        if result.returncode == 0:
+            for out_path, tmp_path in tmp_paths.items():
+                os.replace(tmp_path, out_path)
+            return True
+    except OSError:
+        pass
+    for tmp_path in tmp_paths.values():
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return False
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .clip_planner import VP9_OPTIONS
+from .ffmpeg import run
+
+# Encoder options of each clip format that depend on the machine, before tuning
+DEFAULT_OPTIONS: Dict[str, Dict[str, str]] = {
+    "mp4": {},
+    "webm": {"threads": "8", "speed": "2"},
+}
+
+# Options clips are encoded with regardless of tuning
+BASE_OPTIONS = {"mp4": ["-c:v", "libx264"], "webm": VP9_OPTIONS}
+
+# The option trading quality for speed, and the values tried, slowest first
+SPEEDS: Dict[str, Tuple[str, List[str]]] = {
+    "mp4": ("preset", ["medium", "fast", "faster", "veryfast", "superfast"]),
+    # Speeds over 5 are the same as 5 outside of real-time mode
+    "webm": ("speed", ["2", "3", "4", "5"]),
+}
+
+# Options that only make encoding faster, tried with all speeds
+EXTRA_OPTIONS: Dict[str, Dict[str, str]] = {"mp4": {}, "webm": {"row-mt": "1"}}
+
+# Moving test pattern with grain, so it's about as hard to encode as a film
+SOURCE_FILTER = (
+    "testsrc2=size=%dx%d:rate=24:duration=%d,noise=alls=6:allf=t+u:all_seed=1"
+)
+SOURCE_SECONDS = 2
+
+# Tuned options have to keep the quality of the defaults within this much SSIM,
+SSIM_TOLERANCE = 0.01
+# and make files at most this much bigger
+MAX_SIZE_RATIO = 1.25
+
+_SSIM_RE = re.compile(r"SSIM .*All:([\d.]+)")
+
+
+class Measurement(NamedTuple):
+    options: Dict[str, str]
+    # Time taken to encode the test clip, in seconds
+    seconds: float
+    size: int
+    ssim: float
+
+
+def ffmpeg_options(options: Dict[str, str]) -> List[str]:
+    """Return encoder options as ffmpeg output options."""
+    argv = []
+    for name, value in sorted(options.items()):
+        argv += ["-%s" % name, str(value)]
+    return argv
+
+
+def mpv_options(options: Dict[str, str]) -> str:
+    """Return encoder options in the format of mpv's --ovcopts."""
+    return ",".join("%s=%s" % item for item in sorted(options.items()))
+
+
+def thread_counts(cpu_count: int) -> List[int]:
+    """Powers of two up to the number of CPUs, and the number of CPUs."""
+    counts = [1]
+    while counts[-1] * 2 < cpu_count:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpu_count:
+        counts.append(cpu_count)
+    return counts
+
+
+def available_encoders(ffmpeg: str) -> List[str]:
+    try:
+        result = run([ffmpeg, "-hide_banner", "-nostdin", "-encoders"])
+    except OSError:
+        return []
+    names = []
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and fields[0].startswith("V"):
+            names.append(fields[1])
+    return names
+
+
+def make_source(ffmpeg: str, size: Tuple[int, int], directory: str) -> Optional[str]:
+    """Write the uncompressed test clip, so reading it costs the encoders nothing."""
+    path = os.path.join(directory, "source.nut")
+    argv = [ffmpeg, "-y", "-hide_banner", "-nostdin", "-v", "error", "-f", "lavfi"]
+    argv += ["-i", SOURCE_FILTER % (*size, SOURCE_SECONDS)]
+    argv += ["-c:v", "rawvideo", "-pix_fmt", "yuv420p", path]
+    try:
+        result = run(argv)
+    except OSError:
+        return None
+    return path if result.returncode == 0 else None
+
+
+def measure(
+    ffmpeg: str,
+    source: str,
+    video_format: str,
+    options: Dict[str, str],
+    directory: str,
+) -> Optional[Measurement]:
+    """Encode the test clip with the given options and measure time, size and quality."""
+    output = os.path.join(directory, "clip." + video_format)
+    argv = [ffmpeg, "-y", "-hide_banner", "-nostdin", "-v", "error", "-i", source]
+    argv += ["-an"] + BASE_OPTIONS[video_format] + ffmpeg_options(options)
+    argv += [output]
+    try:
+        started = time.perf_counter()
+        result = run(argv)
+        seconds = time.perf_counter() - started
+        if result.returncode != 0:
+            return None
+        size = os.path.getsize(output)
+        result = run(
+            [ffmpeg, "-hide_banner", "-nostdin", "-i", output, "-i", source]
+            + ["-lavfi", "[0:v][1:v]ssim", "-f", "null", "-"]
+        )
+    except OSError:
+        return None
+    match = _SSIM_RE.search(result.stderr.decode("utf-8", "replace"))
+    if result.returncode != 0 or not match:
+        return None
+    return Measurement(options, seconds, size, float(match.group(1)))
+
+
+def fastest(
+    reference: Measurement, measurements: Sequence[Optional[Measurement]]
+) -> Measurement:
+    """Return the fastest measurement that keeps the quality and size of the reference."""
+    acceptable = [
+        measurement
+        for measurement in measurements
+        if measurement is not None
+        and measurement.ssim >= reference.ssim - SSIM_TOLERANCE
+        and measurement.size <= reference.size * MAX_SIZE_RATIO
+    ]
+    return min(acceptable + [reference], key=lambda measurement: measurement.seconds)
+
+
+def tune_format(
+    ffmpeg: str,
+    source: str,
+    video_format: str,
+    directory: str,
+    cpu_count: int,
+    progress: Callable[[str], None] = lambda label: None,
+) -> Optional[Measurement]:
+    """Find the fastest options for a clip format that are as good as the defaults.
+
+    The speed setting is picked first with all CPUs, trying the fastest ones
+    first until one is good enough, then the number of threads for it.
+    """
+    progress("Measuring %s defaults..." % video_format)
+    reference = measure(
+        ffmpeg, source, video_format, DEFAULT_OPTIONS[video_format], directory
+    )
+    if reference is None:
+        return None
+    name, speeds = SPEEDS[video_format]
+    counts = thread_counts(cpu_count)
+    best = reference
+    for speed in reversed(speeds):
+        progress("Trying %s with %s %s..." % (video_format, name, speed))
+        options = dict(EXTRA_OPTIONS[video_format], threads=str(counts[-1]))
+        options[name] = speed
+        measurement = measure(ffmpeg, source, video_format, options, directory)
+        if fastest(reference, [measurement]) is measurement:
+            best = measurement
+            break
+    measurements = [best]
+    for count in counts[:-1]:
+        progress("Trying %s with %d threads..." % (video_format, count))
+        options = dict(best.options, threads=str(count))
+        measurements.append(measure(ffmpeg, source, video_format, options, directory))
+    return fastest(reference, measurements)
+
+
+def tune_encoders(
+    ffmpeg: str,
+    size: Tuple[int, int],
+    progress: Callable[[str], None] = lambda label: None,
+) -> Dict[str, Dict[str, str]]:
+    """Benchmark the clip encoders on a synthetic clip of the given size.
+
+    Returns the options to encode each clip format with, for the formats whose
+    encoder is available.
+    """
+    encoders = available_encoders(ffmpeg)
+    cpu_count = os.cpu_count() or 1
+    tuned: Dict[str, Dict[str, str]] = {}
+    with tempfile.TemporaryDirectory(prefix="mpv2anki-") as directory:
+        progress("Making the test clip...")
+        source = make_source(ffmpeg, size, directory)
+        if source is None:
+            return tuned
+        for video_format in ("mp4", "webm"):
+            if BASE_OPTIONS[video_format][1] not in encoders:
+                continue
+            best = tune_format(
+                ffmpeg, source, video_format, directory, cpu_count, progress
+            )
+            if best is not None:
+                tuned[video_format] = best.options
+    return tuned
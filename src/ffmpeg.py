@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+# Niceness of processes that yield to others
+LOW_PRIORITY_NICENESS = 10
+
+# Windows' equivalents
+_PROCESS_SET_INFORMATION = 0x0200
+_IDLE_PRIORITY_CLASS = 0x0040
+
+_ionice = shutil.which("ionice") if sys.platform.startswith("linux") else None
+
+
+def popen_options() -> Dict[str, Any]:
+    """Keyword arguments for running ffmpeg from Anki in the background."""
+    env = os.environ.copy()
+    # Anki's bundled libraries break system binaries
+    env.pop("LD_LIBRARY_PATH", None)
+    return {
+        "stdin": subprocess.DEVNULL,
+        "env": env,
+        "creationflags": getattr(subprocess, "CREATE_NO_WINDOW", 0),
+    }
+
+
+def run(argv: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(argv, capture_output=True, check=False, **popen_options())
+
+
+def lower_priority(pid: int) -> None:
+    """Make a running process yield the CPU and, on Linux, the disk to other processes.
+
+    Priorities can't be raised again without privileges, which doesn't matter
+    as a process that yields still gets what nothing else is using.
+    """
+    if sys.platform == "win32":
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32  # type: ignore[attr-defined, unused-ignore]
+        handle = kernel32.OpenProcess(_PROCESS_SET_INFORMATION, False, pid)
+        if handle:
+            kernel32.SetPriorityClass(handle, _IDLE_PRIORITY_CLASS)
+            kernel32.CloseHandle(handle)
+        return
+    try:
+        niceness = os.getpriority(os.PRIO_PROCESS, pid)
+        if niceness < LOW_PRIORITY_NICENESS:
+            os.setpriority(os.PRIO_PROCESS, pid, LOW_PRIORITY_NICENESS)
+    except OSError:
+        # The process has exited
+        return
+    if _ionice is not None:
+        try:
+            run([_ionice, "-c", "3", "-p", str(pid)])
+        except OSError:
+            pass
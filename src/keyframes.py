@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from fractions import Fraction
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .ffmpeg import run
+
+# Video codecs each clip format can hold as they are
+COPY_CODECS = {"mp4": {"h264", "hevc", "av1"}, "webm": {"vp8", "vp9", "av1"}}
+
+# How much earlier than asked a clip may start to start at a keyframe, in seconds
+MAX_WIDENING = 1.0
+
+_TIME_BASE_RE = re.compile(r"^#tb 0: (\d+)/(\d+)")
+_CODEC_RE = re.compile(r"^#codec_id 0: (\w+)")
+_START_RE = re.compile(r"^\s*Duration: .*, start: (-?\d+(?:\.\d+)?)", re.MULTILINE)
+
+
+class Keyframes(NamedTuple):
+    codec: str
+    # Presentation times in seconds from the start of the file, like the player's
+    times: List[float]
+
+    def before(self, time: float) -> Optional[float]:
+        """Return the last keyframe at or before `time`."""
+        idx = bisect_right(self.times, time)
+        return self.times[idx - 1] if idx > 0 else None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"codec": self.codec, "times": self.times}
+
+    @classmethod
+    def from_json(cls, entry: Dict[str, Any]) -> Keyframes:
+        return cls(entry["codec"], entry["times"])
+
+
+def probe_keyframes(ffmpeg: str, path: str) -> Optional[Keyframes]:
+    """Index the keyframes of the first video stream of a file.
+
+    The packets are only read, not decoded, so this takes about as long as
+    reading the file. Their timestamps are read as they are and made relative
+    to the start time of the file, which is where seeking and the player's
+    position count from.
+    """
+    argv = [ffmpeg, "-hide_banner", "-nostdin", "-nostats", "-v", "info"]
+    argv += ["-copyts", "-i", path]
+    argv += ["-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+    try:
+        result = run(argv)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    match = _START_RE.search(result.stderr.decode("utf-8", "replace"))
+    start = float(match.group(1)) if match else 0.0
+
+    codec = None
+    time_base = None
+    times = []
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        if line.startswith("#"):
+            match = _TIME_BASE_RE.match(line)
+            if match:
+                time_base = Fraction(int(match.group(1)), int(match.group(2)))
+            match = _CODEC_RE.match(line)
+            if match:
+                codec = match.group(1)
+            continue
+        # stream, dts, pts, duration, size, crc, and the flags unless it's
+        # just a keyframe
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) < 6 or time_base is None:
+            continue
+        flags = 1
+        if len(fields) > 6 and fields[6].startswith("F="):
+            flags = int(fields[6][2:], 16)
+        if flags & 1:
+            times.append(float(int(fields[2]) * time_base) - start)
+    if codec is None or not times:
+        return None
+    return Keyframes(codec, sorted(times))
+
+
+def copy_start(
+    keyframes: Keyframes, start: float, video_format: str
+) -> Optional[float]:
+    """Return where a clip starting at `start` can start to be cut without re-encoding.
+
+    Returns None if the codec doesn't fit the format or there is no keyframe
+    close enough before `start`.
+    """
+    if keyframes.codec not in COPY_CODECS.get(video_format, ()):
+        return None
+    keyframe = keyframes.before(start + 0.001)
+    if keyframe is None or start - keyframe > MAX_WIDENING:
+        return None
+    return keyframe
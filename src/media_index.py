@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from hashlib import sha1
+from typing import Any, Dict, NamedTuple, Optional
+from uuid import uuid4
+
+
+class MediaOutput(NamedTuple):
+    """A file written by a media job, to be moved to `path` once it's complete."""
+
+    temp_path: str
+    path: str
+    key: str
+
+
+def temp_path(path: str) -> str:
+    """Return a unique hidden path next to `path` with the same extension.
+
+    Encoders pick the output format from the extension, and renaming within
+    the same directory is atomic.
+    """
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, ".%s.%s.part%s" % (stem, uuid4().hex[:8], ext))
+
+
+class MediaIndex:
+    """Remembers how each generated media file was made, so it can be reused.
+
+    Entries map the path of a file to the key of the source and encoding
+    parameters it was made with, and its size. A file is only reused if it
+    still has that size, so files changed or truncated since aren't. Files
+    that are being made are tracked too, so the same output requested again
+    before it's done isn't made twice.
+
+    Entries are kept in an SQLite database and only looked up one at a time,
+    so recording a file doesn't rewrite the index and opening it reads
+    nothing. Errors of the database are ignored; files are then made again.
+    """
+
+    # Part of the keys, so changing it makes all files be made again
+    version = 2
+    schema_version = 1
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, str] = {}
+
+    def key(self, source: str, *params: Any) -> str:
+        """Build a key from the identity of a source file or URL and encoding parameters."""
+        identity: Any = source
+        try:
+            stat = os.stat(source)
+            identity = [os.path.abspath(source), stat.st_mtime_ns, stat.st_size]
+        except (OSError, ValueError):
+            pass
+        blob = json.dumps([self.version, identity, params], sort_keys=True)
+        return sha1(blob.encode("utf-8")).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.schema_version:
+                db.execute("DROP TABLE IF EXISTS files")
+                db.execute("PRAGMA user_version = %d" % self.schema_version)
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    size INTEGER NOT NULL
+                ) WITHOUT ROWID"""
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def claim(self, path: str, key: str) -> bool:
+        """Return whether `path` has to be made, marking it as being made if so.
+
+        It doesn't if it exists and was made with the same key, or is being
+        made with it.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._pending.get(path) == key:
+                return False
+            try:
+                db = self._connect()
+                row = db.execute(
+                    "SELECT key, size FROM files WHERE path = ?", (path,)
+                ).fetchone()
+                if row is not None:
+                    try:
+                        size = os.path.getsize(path)
+                    except OSError:
+                        # Forget files that were deleted, e.g. with their notes
+                        with db:
+                            db.execute("DELETE FROM files WHERE path = ?", (path,))
+                        size = -1
+                    if row[0] == key and size > 0 and size == row[1]:
+                        return False
+            except (OSError, sqlite3.Error):
+                pass
+            self._pending[path] = key
+            return True
+
+    def record(self, path: str, key: str) -> None:
+        """Remember that `path` was made with `key`."""
+        path = os.path.abspath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            self.release(path, key)
+            return
+        with self._lock:
+            if self._pending.get(path) == key:
+                del self._pending[path]
+            try:
+                with self._connect() as db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO files (path, key, size) VALUES (?, ?, ?)",
+                        (path, key, size),
+                    )
+            except (OSError, sqlite3.Error):
+                pass
+
+    def release(self, path: str, key: str) -> None:
+        """Forget that `path` is being made with `key`, e.g. because it failed."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if self._pending.get(path) == key:
+                del self._pending[path]
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import heapq
+import os
+import subprocess
+import threading
+import time
+from itertools import count
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .ffmpeg import lower_priority, popen_options
+from .media_index import MediaIndex, MediaOutput
+
+if TYPE_CHECKING:
+    from .media_journal import MediaJournal
+
+# Job priorities; cheaper jobs run first so quick fields of new cards aren't
+# stuck behind slow encodes of earlier ones
+PRIORITY_IMAGE = 0
+PRIORITY_AUDIO = 1
+PRIORITY_VIDEO = 2
+PRIORITY_VP9 = 3
+
+# While a player is playing, jobs run one at a time, at a low priority, with
+# this many threads for decoding and encoding
+PLAYING_THREADS = 1
+
+# How long no job is started after the player drops frames, in seconds
+DROP_BACKOFF = 5.0
+
+
+class MediaJob(NamedTuple):
+    priority: int
+    argv: List[str]
+    # Files the command writes to temporary paths
+    outputs: Sequence[MediaOutput] = ()
+    # Data for the command's stdin
+    input: Optional[bytes] = None
+
+
+class _Batch:
+    def __init__(self, size: int, on_done: Callable[[bool], None]) -> None:
+        self.remaining = size
+        self.ok = True
+        self.on_done = on_done
+
+
+def default_max_workers() -> int:
+    # Encoders are multi-threaded themselves
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+def limit_threads(job: MediaJob, threads: int) -> List[str]:
+    """Return the command of a job with its decoders and encoders limited to a number of threads."""
+    temp_paths = {output.temp_path for output in job.outputs}
+    argv: List[str] = []
+    for arg in job.argv:
+        if arg.startswith("--o="):
+            # mpv's output
+            argv += ["--vd-lavc-threads=%d" % threads]
+            argv += ["--ovcopts-add=threads=%d" % threads]
+        elif arg == "-i" or arg in temp_paths:
+            # ffmpeg's inputs and outputs; the last -threads before each applies
+            argv += ["-threads", str(threads)]
+        argv.append(arg)
+    return argv
+
+
+class MediaScheduler:
+    """Runs media extraction commands with bounded concurrency, cheapest first.
+
+    Commands are submitted in batches, usually one per card. Each batch's
+    callback is called from a worker thread once all its commands are done.
+    The outputs of a command are only moved into place if it succeeded, and
+    recorded in the index if there is one. Commands are kept in the journal,
+    if there is one, until they're done, so they can be resumed after a crash.
+
+    Jobs yield to players that are playing, so playback doesn't stutter:
+    while any is, one job runs at a time, with few threads and at a low
+    priority, and none is started for a while after frames were dropped.
+    Once none is, the queue is drained as fast as possible again.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        index: Optional[MediaIndex] = None,
+        journal: Optional[MediaJournal] = None,
+    ) -> None:
+        self.max_workers = max_workers or default_max_workers()
+        self.index = index
+        self.journal = journal
+        self._queue: List[
+            Tuple[int, int, Optional[int], MediaJob, _Batch, Dict[str, Any]]
+        ] = []
+        self._order = count()
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._busy = 0
+        # Journal ids of the jobs queued or running in this session
+        self._live: Set[int] = set()
+        self._playing: Set[Hashable] = set()
+        self._backoff_until = 0.0
+        self._processes: Set[subprocess.Popen] = set()
+
+    def set_playing(self, player: Hashable, playing: bool) -> None:
+        """Tell whether a player is playing, as opposed to paused, idle or closed."""
+        with self._condition:
+            if playing:
+                self._playing.add(player)
+                processes = list(self._processes)
+            else:
+                self._playing.discard(player)
+                processes = []
+            self._condition.notify_all()
+        for process in processes:
+            lower_priority(process.pid)
+
+    def frames_dropped(self, player: Hashable) -> None:
+        """Tell that a player dropped frames, so no job is started for a while."""
+        with self._condition:
+            if player in self._playing:
+                self._backoff_until = time.monotonic() + DROP_BACKOFF
+
+    def _start_delay(self) -> Optional[float]:
+        """Seconds until a queued job can start, or None until something changes."""
+        if not self._queue:
+            return None
+        if not self._playing:
+            return 0.0
+        if self._busy:
+            return None
+        return max(0.0, self._backoff_until - time.monotonic())
+
+    def submit(
+        self,
+        jobs: List[MediaJob],
+        on_done: Callable[[bool], None],
+        popen_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Queue a batch of jobs. on_done is called with whether all of them succeeded."""
+        if self.journal is not None:
+            job_ids = self.journal.add(jobs)
+        else:
+            job_ids = [None] * len(jobs)
+        self._push(list(zip(job_ids, jobs)), on_done, popen_kwargs or {})
+
+    def resume(
+        self, select: Callable[[MediaJob], bool], on_done: Callable[[bool], None]
+    ) -> int:
+        """Queue the selected jobs of the journal that were interrupted, and return how many.
+
+        on_done is called with whether all of them succeeded. Jobs whose
+        outputs were all moved into place before the interruption are only
+        marked as done.
+        """
+        entries: List[Tuple[Optional[int], MediaJob]] = []
+        if self.journal is not None:
+            with self._condition:
+                live = set(self._live)
+            for job_id, job in self.journal.unfinished():
+                # Jobs of this session are still on their way, e.g. when the
+                # profile is reopened
+                if job_id in live or not select(job):
+                    continue
+                if self.index is not None:
+                    made = [
+                        not self.index.claim(output.path, output.key)
+                        for output in job.outputs
+                    ]
+                    if made and all(made):
+                        self.journal.finish(job_id, 0, "")
+                        continue
+                entries.append((job_id, job))
+        self._push(entries, on_done, popen_options())
+        return len(entries)
+
+    def _push(
+        self,
+        entries: List[Tuple[Optional[int], MediaJob]],
+        on_done: Callable[[bool], None],
+        popen_kwargs: Dict[str, Any],
+    ) -> None:
+        if not entries:
+            on_done(True)
+            return
+        batch = _Batch(len(entries), on_done)
+        with self._condition:
+            for job_id, job in entries:
+                if job_id is not None:
+                    self._live.add(job_id)
+                heapq.heappush(
+                    self._queue,
+                    (job.priority, next(self._order), job_id, job, batch, popen_kwargs),
+                )
+            while len(self._workers) < min(self.max_workers, len(self._queue)):
+                worker = threading.Thread(
+                    target=self._work, name="mpv2anki-media", daemon=True
+                )
+                self._workers.append(worker)
+                worker.start()
+            self._condition.notify(len(entries))
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                delay = self._start_delay()
+                while delay != 0.0:
+                    self._condition.wait(delay)
+                    delay = self._start_delay()
+                _, _, job_id, job, batch, popen_kwargs = heapq.heappop(self._queue)
+                self._busy += 1
+            try:
+                if self.journal is not None:
+                    self.journal.start(job_id)
+                returncode, stderr = self._run(job, popen_kwargs)
+                ok = self._finish(job, returncode == 0)
+                if self.journal is not None:
+                    if returncode == 0 and not ok:
+                        returncode = -1
+                        stderr = "The outputs couldn't be moved into place."
+                    self.journal.finish(job_id, returncode, stderr)
+            except Exception:
+                # The job fails instead of the worker, which would leave the
+                # job counted as running and its batch never done
+                ok = False
+                try:
+                    self._finish(job, False)
+                except Exception:
+                    pass
+            with self._condition:
+                self._live.discard(job_id)
+                self._busy -= 1
+                batch.ok = batch.ok and ok
+                batch.remaining -= 1
+                done = batch.remaining == 0
+                self._condition.notify_all()
+            if done:
+                batch.on_done(batch.ok)
+
+    def _run(
+        self, job: MediaJob, popen_kwargs: Dict[str, Any]
+    ) -> Tuple[Optional[int], str]:
+        """Run a job and return its exit code, None if it couldn't be started, and error output."""
+        popen_kwargs = dict(popen_kwargs, stderr=subprocess.PIPE)
+        if job.input is not None:
+            popen_kwargs["stdin"] = subprocess.PIPE
+        with self._condition:
+            playing = bool(self._playing)
+        argv = limit_threads(job, PLAYING_THREADS) if playing else job.argv
+        try:
+            process = subprocess.Popen(argv, **popen_kwargs)
+        except OSError as exc:
+            return None, str(exc)
+        with self._condition:
+            self._processes.add(process)
+            playing = bool(self._playing)
+        if playing:
+            lower_priority(process.pid)
+        # Waiting also reaps the process
+        _, stderr = process.communicate(job.input)
+        with self._condition:
+            self._processes.discard(process)
+        return process.returncode, stderr.decode("utf-8", "replace")
+
+    def _finish(self, job: MediaJob, ok: bool) -> bool:
+        for output in job.outputs:
+            if ok:
+                try:
+                    os.replace(output.temp_path, output.path)
+                except OSError:
+                    ok = False
+            if not ok:
+                try:
+                    os.remove(output.temp_path)
+                except OSError:
+                    pass
+            if self.index is not None:
+                if ok:
+                    self.index.record(output.path, output.key)
+                else:
+                    self.index.release(output.path, output.key)
+        return ok
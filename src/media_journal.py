@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .media_index import MediaOutput
+from .media_jobs import MediaJob
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# How much of the error output of failed jobs is kept, in characters
+STDERR_TAIL = 2000
+
+# Finished jobs are forgotten after this many seconds, once reported if they failed
+KEEP_FINISHED = 7 * 24 * 3600
+
+
+class JobFailure(NamedTuple):
+    job_id: int
+    job: MediaJob
+    returncode: Optional[int]
+    stderr: str
+
+
+class MediaJournal:
+    """Keeps track of media jobs on disk, so jobs cut short by a crash can be run again.
+
+    Jobs are recorded as pending when they're submitted and updated when they
+    start and finish, with the exit code and the end of the error output of
+    failed ones. Jobs still pending or running when the journal is opened
+    again were interrupted. Failures are kept until they're reported.
+
+    All methods can be called from any thread. Errors of the database are
+    ignored, so a broken journal never stops media from being made.
+    """
+
+    version = 1
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.version:
+                db.execute("DROP TABLE IF EXISTS jobs")
+                db.execute("PRAGMA user_version = %d" % self.version)
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    argv TEXT NOT NULL,
+                    outputs TEXT NOT NULL,
+                    input BLOB,
+                    returncode INTEGER,
+                    stderr TEXT,
+                    reported INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    finished REAL
+                )"""
+            )
+            db.execute(
+                "DELETE FROM jobs WHERE finished < ? AND (state = ? OR reported)",
+                (time.time() - KEEP_FINISHED, DONE),
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def add(self, jobs: Sequence[MediaJob]) -> List[Optional[int]]:
+        """Record jobs as pending and return their ids, or None for ones that couldn't be."""
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._connect()
+                with db:
+                    return [
+                        db.execute(
+                            "INSERT INTO jobs (state, priority, argv, outputs, input, created)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (
+                                PENDING,
+                                job.priority,
+                                json.dumps(job.argv),
+                                json.dumps([list(output) for output in job.outputs]),
+                                job.input,
+                                now,
+                            ),
+                        ).lastrowid
+                        for job in jobs
+                    ]
+            except (OSError, sqlite3.Error):
+                return [None] * len(jobs)
+
+    def start(self, job_id: Optional[int]) -> None:
+        self._update(job_id, "UPDATE jobs SET state = ? WHERE id = ?", RUNNING)
+
+    def finish(
+        self, job_id: Optional[int], returncode: Optional[int], stderr: str
+    ) -> None:
+        """Record the outcome of a job. A returncode of None means it couldn't be started."""
+        state = DONE if returncode == 0 else FAILED
+        self._update(
+            job_id,
+            "UPDATE jobs SET state = ?, returncode = ?, stderr = ?, input = NULL,"
+            " finished = ? WHERE id = ?",
+            state,
+            returncode,
+            stderr[-STDERR_TAIL:] if state == FAILED else None,
+            time.time(),
+        )
+
+    def mark_reported(self, job_ids: Sequence[int]) -> None:
+        with self._lock:
+            try:
+                db = self._connect()
+                with db:
+                    db.executemany(
+                        "UPDATE jobs SET reported = 1 WHERE id = ?",
+                        [(job_id,) for job_id in job_ids],
+                    )
+            except (OSError, sqlite3.Error):
+                pass
+
+    def unfinished(self) -> List[Tuple[int, MediaJob]]:
+        """Return the jobs that were pending or running, oldest first."""
+        rows = self._select(
+            "SELECT id, priority, argv, outputs, input FROM jobs"
+            " WHERE state IN (?, ?) ORDER BY id",
+            PENDING,
+            RUNNING,
+        )
+        return [(row[0], self._job(*row[1:])) for row in rows]
+
+    def failures(self) -> List[JobFailure]:
+        """Return the failed jobs that weren't reported yet, oldest first."""
+        rows = self._select(
+            "SELECT id, priority, argv, outputs, returncode, stderr FROM jobs"
+            " WHERE state = ? AND NOT reported ORDER BY id",
+            FAILED,
+        )
+        return [
+            JobFailure(row[0], self._job(row[1], row[2], row[3]), row[4], row[5] or "")
+            for row in rows
+        ]
+
+    def _job(
+        self, priority: int, argv: str, outputs: str, data: Optional[bytes] = None
+    ) -> MediaJob:
+        return MediaJob(
+            priority,
+            json.loads(argv),
+            [MediaOutput(*output) for output in json.loads(outputs)],
+            data,
+        )
+
+    def _update(self, job_id: Optional[int], sql: str, *params: object) -> None:
+        if job_id is None:
+            return
+        with self._lock:
+            try:
+                db = self._connect()
+                with db:
+                    db.execute(sql, params + (job_id,))
+            except (OSError, sqlite3.Error):
+                pass
+
+    def _select(self, sql: str, *params: object) -> List[Tuple]:
+        with self._lock:
+            try:
+                return self._connect().execute(sql, params).fetchall()
+            except (OSError, sqlite3.Error):
+                return []
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -133,6 +133,21 @@ function create_anki_card(word)
     reset_timestamps("no-osd")
 end
 
+function create_anki_cards()
+    local status_msg = ""
+
+    if start_timestamp ~= nil and end_timestamp ~= nil and end_timestamp > start_timestamp then
+        status_msg = "[mpv2anki-bulk] " .. start_timestamp .. " # " .. end_timestamp
+    else
+        status_msg = "[mpv2anki-bulk] " .. "-1" .. " # " .. "-1"
+    end
+
+    mp.set_property("term-status-msg", status_msg)
+    mp.add_timeout("0.25", reset_property)
+
+    reset_timestamps("no-osd")
+end
+
 function onclick()
     local mouse_pos = mp.get_property_native('mouse-pos')
     local osd_width = mp.get_property_number('osd-width')
@@ -164,5 +179,6 @@ mp.add_key_binding("ctrl+w", "replay-the-first-seconds", replay_the_first_second
 mp.add_key_binding("ctrl+e", "replay-the-last-seconds", replay_the_last_seconds)
 mp.add_key_binding("ctrl+r", "reset-timestamps", reset_timestamps)
 mp.add_key_binding("b", "create-anki-card", create_anki_card)
+mp.add_key_binding("B", "create-anki-cards", create_anki_cards)
 -- mp.add_key_binding("MBTN_LEFT", "on-click", onclick)
 mp.register_script_message("create-anki-word-card", create_anki_card)
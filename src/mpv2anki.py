@@ -31,27 +31,42 @@ Nickolay <kelciour@gmail.com>
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Literal, Optional, Tuple, cast
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    cast,
+)
 
 __version__ = "1.0.0-alpha3"
 
 
-import glob
 import os
 import re
 import subprocess
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from distutils.spawn import find_executable
 from hashlib import sha1
 from os.path import expanduser
 
+import anki.collection
+from anki.collection import OpChanges, SearchNode
+from anki.decks import DeckId
 from anki.hooks import addHook
 from anki.lang import langs
-from anki.utils import is_lin, is_mac, is_win
-from aqt import mw
+from anki.notes import Note, NoteId
+from anki.utils import ids2str, is_lin, is_mac, is_win, strip_html_media
+from aqt import gui_hooks, mw
 from aqt.qt import *
 from aqt.studydeck import StudyDeck
-from aqt.utils import getOnlyText, showText, showWarning
+from aqt.utils import askUser, getOnlyText, showText, showWarning, tooltip, tr
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "vendor"))
 
@@ -60,19 +75,76 @@ from intersubs.main import run as intersubs_run
 from intersubs.mpv import MPVCommandError
 from intersubs.mpv_intersubs import MPVInterSubs
 
-from . import onclick, popup
+from . import audio_cache, audio_sync, onclick, popup, subs_sync
+from .alignment import align_subtitles
+from .clip_planner import IMAGE_WINDOW, Clip, plan_clips
+from .cues import Cue, CueStore, FileSubtitles
+from .dir_index import DirectoryIndex
+from .embedded_subs import (
+    SubtitleStream,
+    extract_subtitle_streams,
+    matches_language,
+    probe_subtitle_streams,
+)
+from .encoder_tuning import DEFAULT_OPTIONS, ffmpeg_options, mpv_options, tune_encoders
+from .keyframes import Keyframes, copy_start, probe_keyframes
+from .media_index import MediaIndex, MediaOutput, temp_path
+from .media_jobs import (
+    PRIORITY_AUDIO,
+    PRIORITY_IMAGE,
+    PRIORITY_VIDEO,
+    PRIORITY_VP9,
+    MediaJob,
+    MediaScheduler,
+)
+from .media_journal import MediaJournal
 from .onclick import OnClickDictionary
 from .popup import PopupDictionary
 from .popup.intersubs_handler import InterSubsHandler
+from .subs_cache import SubtitlesCache
+from .subs_parser import clean_text, iter_cues, load_text
 
 SubId = Union[int, Literal["auto", "no"]]
 
+# Anki 2.1.65 and older only add notes one at a time
+AddNoteRequest: Optional[Callable[[Note, DeckId], Any]] = getattr(
+    anki.collection, "AddNoteRequest", None
+)
+
 if is_mac and "/usr/local/bin" not in os.environ["PATH"]:
     # https://docs.brew.sh/FAQ#my-mac-apps-dont-find-usrlocalbin-utilities
     os.environ["PATH"] = "/usr/local/bin:" + os.environ["PATH"]
 
 ffmpeg_executable = find_executable("ffmpeg")
 
+# Media files made for cards, so the same clip isn't encoded twice
+media_index = MediaIndex(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "user_files", "media_index.sqlite3"
+    )
+)
+
+# Media jobs that aren't done yet, so they can be finished after a crash
+media_journal = MediaJournal(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "user_files", "media_jobs.sqlite3"
+    )
+)
+
+# Shared by all players, and kept running after they're closed to finish their cards
+media_scheduler = MediaScheduler(index=media_index, journal=media_journal)
+
+# Players opened from the Tools menu, the last one being the current one
+players: List["AnkiHelper"] = []
+
+subs_cache_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "user_files", "subs_cache"
+)
+
+audio_cache_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "user_files", "audio_cache"
+)
+
 langs = [(lang, lc) for lang, lc in langs if not lang.startswith("English")]
 langs = sorted(langs + [("English", "en")])
 
@@ -92,6 +164,25 @@ def secondsToFilename(seconds: float) -> str:
     return secondsToTimestamp(seconds).replace(":", ".")
 
 
+def scaledSize(
+    width: int, height: int, scale_width: int, scale_height: int
+) -> Tuple[int, int]:
+    """Return the size the lavfi scale filter gives an image for the given width and height.
+
+    0 keeps the original, and a negative value keeps the aspect ratio and rounds
+    to a multiple of its magnitude.
+    """
+    new_width = scale_width or width
+    new_height = scale_height or height
+    if new_width < 0 and new_height < 0:
+        new_width, new_height = width, height
+    elif new_width < 0:
+        new_width = round(new_height * width / height / -new_width) * -new_width
+    elif new_height < 0:
+        new_height = round(new_width * height / width / -new_height) * -new_height
+    return max(new_width, 1), max(new_height, 1)
+
+
 def getVideoFile() -> List[QUrl]:
     key = "Media (*.avi *.mkv *.mp4 *.mov *.mpg *.mpeg *.webm *.m4a *.mp3 *.wav);;All Files (*.*)"
     dirkey = "1213145732" + "Directory"
@@ -122,122 +213,536 @@ def seconds_to_srt_time(time: float) -> str:
     return "%02d:%02d:%02d,%03d" % getTimeParts(time)
 
 
-srt_encodings = ["utf-8", "cp1251"]
-
-
-def fix_glob_square_brackets(glob_pattern: str) -> str:
-    # replace the left square bracket with [[]
-    glob_pattern = re.sub(r"\[", "[[]", glob_pattern)
-    # replace the right square bracket with []] but be careful not to replace
-    # the right square brackets in the left square bracket's 'escape' sequence.
-    glob_pattern = re.sub(r"(?<!\[)\]", "[]]", glob_pattern)
-
-    return glob_pattern
-
-
 class SubtitlesHelper:
     def __init__(self, configManager: "ConfigManager"):
         self.settings = configManager.getSettings()
+        self.cache = configManager.getSubtitlesCache()
+        self.dirIndex = DirectoryIndex()
         self.sub_delay = 0.0
+        self.loaded = FileSubtitles()
+        # Subtitles are looked up and processed one file at a time by the loader,
+        # which parses the target and native-language files in parallel.
+        self.loader = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="mpv2anki-loader"
+        )
+        self.parser = ThreadPoolExecutor(thread_name_prefix="mpv2anki-parser")
+        # Decoding audio takes a while, so it doesn't hold up loading subtitles
+        self.syncer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="mpv2anki-audio-sync"
+        )
+        self.indexer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="mpv2anki-keyframes"
+        )
+        self.closed = False
+        # Audio envelope and keyframes of the loaded file, once they're there
+        self.envelope: Optional[Any] = None
+        self.keyframes: Optional[Keyframes] = None
+        # Decoded audio track of the loaded file to cut clips from, and its index
+        self.pcm: Optional[Tuple[int, Any]] = None
+        self.pcm_source: Optional[Tuple[str, int]] = None
+        self.loading: Future[FileSubtitles] = Future()
+        self.loading.set_result(self.loaded)
+        self.prefetched: Dict[str, Future[FileSubtitles]] = {}
 
     sub_exts = [".srt", ".ass", ".vtt"]
+    # Parsed without pysubs2
+    plain_sub_exts = [".srt", ".vtt"]
+    # How many of the next playlist entries get their subtitles loaded in advance
+    prefetch_limit = 2
+
+    def load(
+        self, filePath: str, on_track_ready: Optional[Callable[[str], None]] = None
+    ) -> Future[FileSubtitles]:
+        """Load the subtitles of a file in the background.
+
+        on_track_ready is called from the loader thread with the path of each
+        subtitle file as soon as it can be shown.
+        """
+        prefetched = self.prefetched.pop(filePath, None)
+        if prefetched is not None and prefetched.cancel():
+            prefetched = None
+        # Don't keep this file waiting for others that may never be played
+        for path, future in list(self.prefetched.items()):
+            if future.cancel():
+                del self.prefetched[path]
+        self.loaded = FileSubtitles(filePath)
+        self.envelope = None
+        self.keyframes = None
+        self.pcm = None
+        self.pcm_source = None
+        self.loading = self.loader.submit(
+            self.init, filePath, on_track_ready, prefetched
+        )
+        self.loading.add_done_callback(self.on_loaded)
+        return self.loading
+
+    def prefetch(self, filePaths: Sequence[str]) -> None:
+        """Load the subtitles of the files to be played next once the current file is done.
+
+        Files that are no longer coming up are cancelled.
+        """
+        filePaths = [path for path in filePaths if "://" not in path]
+        filePaths = filePaths[: self.prefetch_limit]
+        for path, future in list(self.prefetched.items()):
+            if path not in filePaths:
+                future.cancel()
+                del self.prefetched[path]
+        for path in filePaths:
+            if path not in self.prefetched and path != self.loaded.filePath:
+                self.prefetched[path] = self.loader.submit(
+                    self.read_file_subtitles, path
+                )
 
-    def init(self, filePath: str) -> None:
-        self.filePath = filePath
-        self.subsPath = None
-        self.translationsPath = None
-        self.status_code = "success"
+    def on_loaded(self, future: Future[FileSubtitles]) -> None:
+        if not future.cancelled() and future.exception():
+            self.warn("Failed to load subtitles:\n\n%s" % future.exception())
+
+    def init(
+        self,
+        filePath: str,
+        on_track_ready: Optional[Callable[[str], None]] = None,
+        prefetched: Optional[Future[FileSubtitles]] = None,
+    ) -> FileSubtitles:
+        if prefetched is not None:
+            # It was past cancelling, so it's done by the time the loader gets here
+            loaded = prefetched.result()
+            notify = self.track_notifier(on_track_ready)
+            for path in loaded.paths:
+                notify(path)
+        else:
+            loaded = self.read_file_subtitles(filePath, on_track_ready)
+        # Don't replace the subtitles of a file that was opened in the meantime
+        if self.loaded.filePath == filePath:
+            self.loaded = loaded
+        return loaded
+
+    def read_file_subtitles(
+        self, filePath: str, on_track_ready: Optional[Callable[[str], None]] = None
+    ) -> FileSubtitles:
+        on_track_ready = self.track_notifier(on_track_ready)
+
+        subs_base_path = os.path.splitext(filePath)[0]
+        subsPaths = self.find_target_subtitles(subs_base_path)
+        translationsPaths = []
+        for lang in self.native_language_codes():
+            subs_list = self.find_subtitles(subs_base_path, lang)
+            if len(subs_list) > 0:
+                translationsPaths.append(subs_list[0])
+        if not subsPaths:
+            subsPaths, embeddedPaths = self.extract_embedded_subtitles(filePath)
+            if not translationsPaths:
+                translationsPaths = embeddedPaths
+
+        cache_key = None
+        if subsPaths:
+            cache_key = self.cache.key(
+                subsPaths + translationsPaths, self.processing_options()
+            )
+        entry: Optional[Dict[str, Any]] = None
+        if cache_key:
+            entry = self.cache.get(cache_key)
+        if entry is not None:
+            # Cues are cached as [start, end, text] arrays, read the same as tuples
+            cached_subs: List[Cue] = list(entry["subs"])
+            cached_translations: List[Cue] = list(entry["translations"])
+            loaded = FileSubtitles(
+                filePath,
+                entry["subsPath"],
+                translationsPaths,
+                CueStore(cached_subs, cached_translations),
+            )
+            for path in loaded.paths:
+                on_track_ready(path)
+            return loaded
 
-        self.subs = []
-        self.translations = []
+        subsPath, subs, translations, status_code = self.load_subtitles(
+            subsPaths, translationsPaths, on_track_ready
+        )
+        if cache_key and status_code == "success":
+            self.cache.put(
+                cache_key,
+                {
+                    "subsPath": subsPath,
+                    "subs": subs,
+                    "translations": translations,
+                },
+            )
+        return FileSubtitles(
+            filePath,
+            subsPath,
+            translationsPaths,
+            CueStore(subs, translations),
+            status_code,
+        )
 
-        subs_base_path = os.path.splitext(self.filePath)[0]
+    def load_subtitles(
+        self,
+        subsPaths: List[str],
+        translationsPaths: List[str],
+        on_track_ready: Callable[[str], None],
+    ) -> Tuple[Optional[str], List[Cue], List[Cue], str]:
+        track_futures = [
+            self.parser.submit(self.read_subtitles, path) for path in translationsPaths
+        ]
+        status_code = "success"
+
+        subsPath = None
+        subs: Optional[List[Cue]] = []
+        for subsPath in subsPaths:
+            subs = self.read_subtitles(subsPath)
+            if subs is None:
+                status_code = "error"
+            if subs:
+                break
+        # Keep the order the tracks were always added in
+        for path in ([subsPath] if subsPath else []) + translationsPaths:
+            on_track_ready(path)
+
+        tracks = []
+        for future in track_futures:
+            track = future.result()
+            if track is None:
+                status_code = "error"
+            elif track:
+                tracks.append(track)
+
+        if not subs:
+            return subsPath, [], [], status_code
+
+        if self.settings["subs_target_language_code"] == "en":
+            subs = self.convert_into_sentences(subs)
+
+        translations: List[Cue] = []
+        if len(tracks) != 0:
+            subs, translations = self.sync_subtitles(subs, tracks)
+
+        return subsPath, subs, translations, status_code
+
+    def track_notifier(
+        self, on_track_ready: Optional[Callable[[str], None]]
+    ) -> Callable[[str], None]:
+        def notify(path: str) -> None:
+            # mpv already has the tracks that were extracted from the file itself
+            if on_track_ready is not None and not self.cache.owns(path):
+                on_track_ready(path)
+
+        return notify
+
+    def extract_embedded_subtitles(self, filePath: str) -> Tuple[List[str], List[str]]:
+        """Extract the text subtitle tracks of a media file in the configured languages
+        into the cache, once per file.
+
+        Returns the target language candidates and the native-language tracks.
+        """
+        if not ffmpeg_executable or "://" in filePath:
+            return [], []
+        probe_key = self.cache.key([filePath], {"probe": "subtitle_streams"})
+        if probe_key is None:
+            return [], []
+        entry = self.cache.get(probe_key)
+        if entry:
+            streams = [SubtitleStream(*stream) for stream in entry["streams"]]
+        else:
+            probed = probe_subtitle_streams(ffmpeg_executable, filePath)
+            if probed is None:
+                return [], []
+            streams = probed
+            self.cache.put(probe_key, {"streams": streams})
+
+        def find_stream(code: str) -> Optional[SubtitleStream]:
+            for stream in streams:
+                if matches_language(stream, code):
+                    return stream
+            return None
+
+        target_code = self.settings["subs_target_language_code"]
+        subs_stream = find_stream(target_code) if target_code else None
+        if subs_stream is None:
+            # Like subtitles named after the video only, a track without a language
+            subs_stream = find_stream("") or find_stream("und")
+        native_streams = [
+            stream
+            for stream in map(find_stream, self.native_language_codes())
+            if stream is not None and stream != subs_stream
+        ]
+        if subs_stream is None:
+            return [], []
+
+        paths: Dict[int, str] = {}
+        outputs: Dict[int, str] = {}
+        for stream in [subs_stream] + native_streams:
+            key = self.cache.key([filePath], {"stream": stream.ff_index})
+            if key is None:
+                return [], []
+            paths[stream.ff_index] = self.cache.track_path(key)
+            if not os.path.exists(paths[stream.ff_index]):
+                outputs[stream.ff_index] = paths[stream.ff_index]
+        if outputs:
+            if not extract_subtitle_streams(ffmpeg_executable, filePath, outputs):
+                return [], []
+            self.cache.evict()
+
+        return [paths[subs_stream.ff_index]], [
+            paths[stream.ff_index] for stream in native_streams
+        ]
+
+    def shutdown(self) -> None:
+        self.closed = True
+        self.loader.shutdown(wait=False, cancel_futures=True)
+        self.parser.shutdown(wait=False, cancel_futures=True)
+        self.syncer.shutdown(wait=False, cancel_futures=True)
+        self.indexer.shutdown(wait=False, cancel_futures=True)
+
+    def audio_analysis_enabled(self) -> bool:
+        return bool(
+            (
+                self.settings.get("subs_audio_sync", True)
+                or self.settings.get("snap_to_silence", True)
+            )
+            and ffmpeg_executable
+            and subs_sync.is_available()
+        )
+
+    def analyze_audio(
+        self, filePath: str, audio_index: int, on_synced: Callable[[float], None]
+    ) -> Future[Optional[float]]:
+        """Get the audio envelope of a file in the background, then estimate the
+        subtitle delay from it.
+
+        on_synced is called from the worker thread with the delay if one is found.
+        """
+        return self.syncer.submit(
+            self.estimate_audio_delay, filePath, audio_index, self.loading, on_synced
+        )
+
+    def estimate_audio_delay(
+        self,
+        filePath: str,
+        audio_index: int,
+        loading: Future[FileSubtitles],
+        on_synced: Callable[[float], None],
+    ) -> Optional[float]:
+        envelope = self.audio_envelope(filePath, audio_index)
+        if envelope is None:
+            return None
+        if self.loaded.filePath == filePath:
+            self.envelope = envelope
+        if not self.settings.get("subs_audio_sync", True):
+            return None
+        loaded = loading.result()
+        if loaded.filePath != filePath or len(loaded.cues) == 0:
+            return None
+        delay = audio_sync.estimate_delay(
+            envelope, loaded.cues.starts, loaded.cues.ends
+        )
+        if delay is not None:
+            on_synced(delay)
+        return delay
+
+    def audio_envelope(self, filePath: str, audio_index: int) -> Optional[Any]:
+        key = self.cache.key(
+            [filePath],
+            {"envelope": audio_index, "resolution": audio_sync.ENVELOPE_RESOLUTION},
+        )
+        if key is None:
+            return None
+        path = self.cache.envelope_path(key)
+        envelope = audio_sync.load_envelope(path)
+        if envelope is None:
+            envelope = audio_sync.decode_envelope(
+                ffmpeg_executable,
+                filePath,
+                audio_index,
+                # Stop decoding for a file that was closed in the meantime
+                lambda: self.closed or self.loaded.filePath != filePath,
+            )
+            if envelope is None:
+                return None
+            audio_sync.save_envelope(path, envelope)
+            self.cache.evict()
+        return envelope
+
+    def audio_cache_enabled(self) -> bool:
+        return bool(
+            self.settings.get("cache_decoded_audio", True)
+            and ffmpeg_executable
+            and subs_sync.is_available()
+        )
+
+    def cache_audio(self, filePath: str, audio_index: int) -> None:
+        """Decode an audio track of a file in the background to cut clips from."""
+        if self.pcm_source == (filePath, audio_index):
+            return
+        self.pcm = None
+        self.pcm_source = (filePath, audio_index)
+        self.syncer.submit(self.load_pcm, filePath, audio_index)
+
+    def load_pcm(self, filePath: str, audio_index: int) -> None:
+        key = self.cache.key(
+            [filePath], {"pcm": audio_index, "rate": audio_cache.SAMPLE_RATE}
+        )
+        if key is None:
+            return
+        path = os.path.join(audio_cache_dir, key + ".pcm")
+        pcm = audio_cache.load_pcm(path)
+        if pcm is None:
+            if not audio_cache.decode_pcm(
+                ffmpeg_executable,
+                filePath,
+                audio_index,
+                path,
+                # Stop decoding a track that's no longer played
+                lambda: self.closed or self.pcm_source != (filePath, audio_index),
+            ):
+                return
+            audio_cache.prune(audio_cache_dir)
+            pcm = audio_cache.load_pcm(path)
+        if pcm is not None and self.pcm_source == (filePath, audio_index):
+            self.pcm = (audio_index, pcm)
+
+    def cut_audio(self, audio_index: int, start: float, end: float) -> Optional[bytes]:
+        """Return the PCM of an audio clip from the decoded track, if it's ready."""
+        pcm = self.pcm
+        if pcm is None or pcm[0] != audio_index:
+            return None
+        return audio_cache.cut_clip(pcm[1], start, end)
+
+    def keyframes_enabled(self) -> bool:
+        return bool(self.settings.get("fast_video_clips", False) and ffmpeg_executable)
+
+    def index_keyframes(self, filePath: str) -> Future[Optional[Keyframes]]:
+        """Get the keyframes of the video of a file in the background."""
+        return self.indexer.submit(self.load_keyframes, filePath)
+
+    def load_keyframes(self, filePath: str) -> Optional[Keyframes]:
+        key = self.cache.key([filePath], {"keyframes": 2})
+        if key is None:
+            return None
+        entry = self.cache.get(key)
+        keyframes = Keyframes.from_json(entry) if entry is not None else None
+        if keyframes is None:
+            keyframes = probe_keyframes(ffmpeg_executable, filePath)
+            if keyframes is None:
+                return None
+            self.cache.put(key, keyframes.to_json())
+        if self.loaded.filePath == filePath:
+            self.keyframes = keyframes
+        return keyframes
+
+    def pad_clip(
+        self,
+        start: float,
+        end: float,
+        pad_start: float,
+        pad_end: float,
+        audio_delay: float = 0.0,
+    ) -> Tuple[float, float]:
+        """Return the boundaries of a clip of the speech between start and end.
+
+        Each padded boundary is moved to the nearest quiet point of the audio
+        within its padding, so clips don't start or end in the middle of a word.
+        """
+        clip_start, clip_end = start - pad_start, end + pad_end
+        envelope = self.envelope
+        if envelope is None or not self.settings.get("snap_to_silence", True):
+            return clip_start, clip_end
+        # The envelope is in the time of the audio track, which plays audio_delay late
+        if pad_start > 0:
+            snapped = audio_sync.snap_to_silence(
+                envelope,
+                clip_start - audio_delay,
+                start - audio_delay,
+                clip_start - audio_delay,
+            )
+            if snapped is not None:
+                clip_start = snapped + audio_delay
+        if pad_end > 0:
+            snapped = audio_sync.snap_to_silence(
+                envelope,
+                end - audio_delay,
+                clip_end - audio_delay,
+                clip_end - audio_delay,
+            )
+            if snapped is not None:
+                clip_end = snapped + audio_delay
+        return clip_start, clip_end
+
+    def processing_options(self) -> Dict[str, Any]:
+        # Everything that changes the result of load_subtitles() for the same files
+        return {
+            "target": self.settings["subs_target_language_code"],
+            "native": self.native_language_codes(),
+            "sentences": self.settings["subs_target_language_code"] == "en",
+            "auto_sync": self.auto_sync(),
+        }
+
+    def find_target_subtitles(self, subs_base_path: str) -> List[str]:
+        # Candidates in order of preference; the first one with any subs is used
+        subsPaths = []
         if self.settings["subs_target_language_code"]:
             subs_list = self.find_subtitles(
                 subs_base_path, self.settings["subs_target_language_code"]
             )
             if len(subs_list) > 0:
-                self.subsPath = subs_list[0]
-                self.subs = self.read_subtitles(self.subsPath)
-
-        if not self.subs:
-            for ext in self.sub_exts:
-                if os.path.isfile(subs_base_path + ext):
-                    self.subsPath = subs_base_path + ext
-                    self.subs = self.read_subtitles(self.subsPath)
-                    break
+                subsPaths.append(subs_list[0])
 
-        if self.settings["subs_native_language_code"]:
-            subs_list = self.find_subtitles(
-                subs_base_path, self.settings["subs_native_language_code"]
-            )
-            if len(subs_list) > 0:
-                self.translationsPath = subs_list[0]
-                self.translations = self.read_subtitles(self.translationsPath)
+        for ext in self.sub_exts:
+            if self.dirIndex.isfile(subs_base_path + ext):
+                if subs_base_path + ext not in subsPaths:
+                    subsPaths.append(subs_base_path + ext)
+                break
 
-        if len(self.subs) != 0 and self.settings["subs_target_language_code"] == "en":
-            self.convert_into_sentences()
+        return subsPaths
 
-        if len(self.translations) != 0:
-            self.sync_subtitles()
+    def native_language_codes(self) -> List[str]:
+        codes = [
+            self.settings["subs_native_language_code"],
+            self.settings.get("subs_second_native_language_code", ""),
+        ]
+        return [code for code in codes if code]
 
     def find_subtitles(self, subs_base_path: str, lang: str = "") -> List[str]:
         subs_list = []
         for ext in self.sub_exts:
-            subs_filepattern = subs_base_path + "*" + lang + "*" + ext
-            subs_filepattern = fix_glob_square_brackets(subs_filepattern)
-            subs_list.extend(glob.glob(subs_filepattern))
+            subs_list.extend(self.dirIndex.find(subs_base_path, lang, ext))
         return subs_list
 
-    def guess_encoding(self, file_content: bytes) -> Tuple[bool, str]:
-        for enc in srt_encodings:
-            try:
-                content = file_content.decode(enc)
-                return (True, enc)
-            except UnicodeDecodeError:
-                pass
-        return (False, None)
+    def warn(self, msg: str) -> None:
+        def show() -> None:
+            showWarning(msg, parent=mw)
 
-    def read_subtitles(self, subsPath: str) -> List[Tuple[float, float, str]]:
-        with open(subsPath, "rb") as file:
-            content = file.read()
-            if content[:3] == b"\xef\xbb\xbf":  # with bom
-                content = content[3:]
+        # Subtitles are read in background threads
+        mw.taskman.run_on_main(show)
 
-            ret_code, enc = self.guess_encoding(content)
-            if not ret_code:
-                showWarning(
-                    "Can't decode subtitles. Please convert subtitles to UTF-8 encoding."
-                )
-
-        try:
-            subs = pysubs2.load(subsPath, encoding=enc)
-        except Exception as e:
-            showWarning(
-                "An error occurred while parsing the subtitle file:\n'%s'.\n\n%s"
-                % (os.path.basename(subsPath), e),
-                parent=mw,
+    def read_subtitles(self, subsPath: str) -> Optional[List[Cue]]:
+        """Return the cues of a subtitle file, or None if it can't be read."""
+        content = load_text(subsPath)
+        if content is None:
+            self.warn(
+                "Can't decode subtitles. Please convert subtitles to UTF-8 encoding."
             )
-            self.status_code = "error"
+            return None
+        if not content.strip():
             return []
 
-        subs2 = []
-        for line in subs:
-            subs2.append((line.start / 1000, line.end / 1000, line.text))
-
         subs = []
-        for sub_start, sub_end, sub_text in subs2:
-            sub_chunks = sub_text.split("\\N")
-            sub_content = "\n".join(sub_chunks).replace("\t", " ")
-            sub_content = re.sub(r"<[^>]+>", "", sub_content)
-            sub_content = re.sub(r"^-", r"- ", sub_content)
-            sub_content = re.sub(
-                r"(\W)-([^\W])", r"\1 - \2", sub_content, flags=re.UNICODE
-            )
-            sub_content = re.sub(r"  +", " ", sub_content)
-            sub_content = sub_content.replace("\n", " ").strip()
-            if len(sub_content) > 0:
-                subs.append((sub_start, sub_end, sub_content))
+        if os.path.splitext(subsPath)[1].lower() in self.plain_sub_exts:
+            subs = list(iter_cues(content))
+
+        if not subs:
+            try:
+                ssa_file = pysubs2.SSAFile.from_string(content)
+            except Exception as e:
+                self.warn(
+                    "An error occurred while parsing the subtitle file:\n'%s'.\n\n%s"
+                    % (os.path.basename(subsPath), e)
+                )
+                return None
+
+            for line in ssa_file:
+                sub_content = clean_text(line.text)
+                if len(sub_content) > 0:
+                    subs.append((line.start / 1000, line.end / 1000, sub_content))
 
         return subs
 
@@ -248,10 +753,10 @@ class SubtitlesHelper:
 
         return sub
 
-    def convert_into_sentences(self) -> None:
+    def convert_into_sentences(self, cues: List[Cue]) -> List[Cue]:
         subs: List[Tuple[float, float, str]] = []
 
-        for sub in self.subs:
+        for sub in cues:
             sub_start = sub[0]
             sub_end = sub[1]
             sub_content = sub[2]
@@ -287,114 +792,31 @@ class SubtitlesHelper:
             else:
                 subs.append((sub_start, sub_end, sub_content))
 
-        self.subs = subs
-
-    def sync_subtitles(self) -> None:
-        en_subs = self.subs
-        ru_subs = self.translations
-
-        subs: List[Tuple[List, List, List]] = [
-            ([], [], []) for i in range(len(en_subs))
-        ]
-        for ru_sub in ru_subs:
-            ru_sub_start = ru_sub[0]
-            ru_sub_end = ru_sub[1]
-
-            for idx, en_sub in enumerate(en_subs):
-                en_sub_start = en_sub[0]
-                en_sub_end = en_sub[1]
+        return subs
 
-                if en_sub_start < ru_sub_end and en_sub_end > ru_sub_start:
-                    sub_start = (
-                        en_sub_start if en_sub_start > ru_sub_start else ru_sub_start
-                    )
-                    sub_end = en_sub_end if ru_sub_end > en_sub_end else ru_sub_end
-
-                    if (sub_end - sub_start) / (ru_sub_end - ru_sub_start) > 0.25:
-                        subs[idx][0].append(ru_sub[0])
-                        subs[idx][1].append(ru_sub[1])
-                        subs[idx][2].append(ru_sub[2])
-                        break
-
-        self.translations = []
-        for idx, sub in enumerate(subs):
-            if len(sub[2]) == 0:
-                self.translations.append((self.subs[idx][0], self.subs[idx][1], ""))
-            else:
-                self.translations.append((sub[0][0], sub[1][-1], " ".join(sub[2])))
-
-        idx = 0
-        while idx < len(self.subs) and len(self.subs) > 1:
-            if self.translations[idx][2] == "":
-                en_sub_start = self.subs[idx][0]
-                en_sub_end = self.subs[idx][1]
-
-                ru_prev_sub_start = 0.0
-                ru_prev_sub_end = 0.0
-                ru_next_sub_start = 0.0
-                ru_next_sub_end = 0.0
-
-                if idx > 0:
-                    ru_prev_sub_start = self.translations[idx - 1][0]
-                    ru_prev_sub_end = self.translations[idx - 1][1]
-
-                if idx < len(self.subs) - 1:
-                    ru_next_sub_start = self.translations[idx + 1][0]
-                    ru_next_sub_end = self.translations[idx + 1][1]
-
-                if idx == len(self.subs) - 1:
-                    self.subs[idx - 1] = (
-                        self.subs[idx - 1][0],
-                        self.subs[idx][1],
-                        self.subs[idx - 1][2] + " " + self.subs[idx][2],
-                    )
-                elif en_sub_end <= ru_next_sub_start and idx > 0:
-                    self.subs[idx - 1] = (
-                        self.subs[idx - 1][0],
-                        self.subs[idx][1],
-                        self.subs[idx - 1][2] + " " + self.subs[idx][2],
-                    )
-                elif (
-                    en_sub_start >= ru_next_sub_start or en_sub_start >= ru_prev_sub_end
-                ):
-                    self.subs[idx + 1] = (
-                        self.subs[idx][0],
-                        self.subs[idx + 1][1],
-                        self.subs[idx][2] + " " + self.subs[idx + 1][2],
-                    )
-                elif (ru_prev_sub_end - en_sub_start) > (
-                    en_sub_end - ru_next_sub_start
-                ) and idx > 0:
-                    self.subs[idx - 1] = (
-                        self.subs[idx - 1][0],
-                        self.subs[idx][1],
-                        self.subs[idx - 1][2] + " " + self.subs[idx][2],
-                    )
-                else:
-                    self.subs[idx + 1] = (
-                        self.subs[idx][0],
-                        self.subs[idx + 1][1],
-                        self.subs[idx][2] + " " + self.subs[idx + 1][2],
-                    )
+    def sync_subtitles(
+        self, subs: List[Cue], tracks: List[List[Cue]]
+    ) -> Tuple[List[Cue], List[Cue]]:
+        if self.auto_sync():
+            tracks = [subs_sync.sync_track(subs, track) for track in tracks]
+        return align_subtitles(subs, tracks)
 
-                del self.subs[idx]
-                del self.translations[idx]
-            else:
-                idx += 1
+    def auto_sync(self) -> bool:
+        return self.settings.get("subs_auto_sync", True) and subs_sync.is_available()
 
     def filter_subtitles(
         self, clip_start: float, clip_end: float, pad_start: float, pad_end: float
     ) -> List[Tuple[float, float, str]]:
         subs_filtered = []
 
-        for sub_start, sub_end, sub_content in self.subs:
-            if sub_end > (clip_start + pad_start) and sub_start < (clip_end - pad_end):
-                subs_filtered.append(
-                    (sub_start - clip_start, sub_end - clip_start, sub_content)
-                )
-
-            if sub_start > clip_end:
-                break
+        loaded = self.loaded
+        for sub_id in loaded.timeline.overlapping(
+            clip_start + pad_start, clip_end - pad_end
+        ):
+            sub_start, sub_end, sub_content = loaded.cues.cue(sub_id)
+            subs_filtered.append(
+                (sub_start - clip_start, sub_end - clip_start, sub_content)
+            )
 
         return subs_filtered
 
@@ -423,52 +845,55 @@ class SubtitlesHelper:
                 file.write("\n")
 
     def get_subtitle_id(self, time_pos: float) -> Optional[int]:
-        time_pos = time_pos - self.sub_delay
-        for sub_id, (sub_start, sub_end, sub_content) in enumerate(self.subs):
-            if sub_start <= time_pos <= sub_end:
-                return sub_id
-        return None
+        return self.loaded.timeline.find(time_pos, self.sub_delay)
+
+    def get_subtitle_ids(self, start: float = -1, end: float = -1) -> List[int]:
+        """Return the ids of the subtitles shown between start and end, or of all of them."""
+        if start >= 0 and end > start:
+            return self.loaded.timeline.overlapping(start, end, self.sub_delay)
+        return list(range(len(self.loaded.cues)))
 
     def get_subtitle(
         self, sub_id: int, translation: bool = False
     ) -> Tuple[Optional[float], Optional[float], str]:
+        cues = self.loaded.cues
         if (
             sub_id < 0
-            or sub_id > len(self.subs) - 1
-            or (translation is True and len(self.translations) == 0)
+            or sub_id > len(cues) - 1
+            or (translation is True and not cues.has_translations)
         ):
             return (None, None, "")
         if not translation:
-            return self.subs[sub_id]
-        return self.translations[sub_id]
+            return cues.cue(sub_id)
+        return cues.translation(sub_id)
 
     def get_prev_subtitle(
         self, sub_id: int, translation: bool = False
     ) -> Tuple[float, float, str]:
-        if sub_id <= 0 or (translation is True and len(self.translations) == 0):
-            return (self.subs[0][0], self.subs[0][1], "")
-        sub_start, sub_end, sub_text = self.subs[sub_id]
-        prev_sub_start, prev_sub_end, prev_sub_text = self.subs[sub_id - 1]
-        if sub_start - prev_sub_end > 5:
-            return (sub_start, sub_end, "")
+        cues = self.loaded.cues
+        starts, ends = cues.starts, cues.ends
+        if sub_id <= 0 or (translation is True and not cues.has_translations):
+            return (starts[0], ends[0], "")
+        if starts[sub_id] - ends[sub_id - 1] > 5:
+            return (starts[sub_id], ends[sub_id], "")
         if not translation:
-            return self.subs[sub_id - 1]
-        return self.translations[sub_id - 1]
+            return cues.cue(sub_id - 1)
+        return cues.translation(sub_id - 1)
 
     def get_next_subtitle(
         self, sub_id: int, translation: bool = False
     ) -> Tuple[float, float, str]:
-        if sub_id >= len(self.subs) - 1 or (
-            translation is True and len(self.translations) == 0
+        cues = self.loaded.cues
+        starts, ends = cues.starts, cues.ends
+        if sub_id >= len(cues) - 1 or (
+            translation is True and not cues.has_translations
         ):
-            return (self.subs[-1][0], self.subs[-1][1], "")
-        sub_start, sub_end, sub_text = self.subs[sub_id]
-        next_sub_start, next_sub_end, next_sub_text = self.subs[sub_id + 1]
-        if next_sub_start - sub_end > 5:
-            return (sub_start, sub_end, "")
+            return (starts[-1], ends[-1], "")
+        if starts[sub_id + 1] - ends[sub_id] > 5:
+            return (starts[sub_id], ends[sub_id], "")
         if not translation:
-            return self.subs[sub_id + 1]
-        return self.translations[sub_id + 1]
+            return cues.cue(sub_id + 1)
+        return cues.translation(sub_id + 1)
 
 
 class ConfigManager:
@@ -499,6 +924,11 @@ class ConfigManager:
     def getSettings(self) -> Dict[str, Any]:
         return self.config["presets"][self.getConfiguredPreset()]
 
+    def getSubtitlesCache(self) -> SubtitlesCache:
+        return SubtitlesCache(
+            subs_cache_dir, self.config["subs_cache_size_mb"] * 1024 * 1024
+        )
+
     def getFields(self, forDisplay: bool = False) -> List[str]:
         fields = [
             "<ignored>",
@@ -546,6 +976,7 @@ class ConfigManager:
 # Fix for ... cannot be converted to PyQt5.QtCore.QObject in this context
 class MessageHandler(QObject):
     create_anki_card = pyqtSignal(str, float, float, float, str)
+    create_anki_cards = pyqtSignal(float, float)
     update_file_path = pyqtSignal(str)
 
 
@@ -569,15 +1000,9 @@ class MPVMonitor(MPVInterSubs):
         ytdl_opts = '--ytdl-raw-options=write-sub=,write-auto-sub=,sub-format="ass/srt/vtt/best"'
         if any("youtube.com" in l for l in fileUrls):
             # Download only native and target languages' auto-generated subs for YouTube
-            sub_langs = list(
-                filter(
-                    None,
-                    [
-                        self.subsManager.settings["subs_native_language_code"],
-                        self.subsManager.settings["subs_target_language_code"],
-                    ],
-                )
-            )
+            sub_langs = self.subsManager.native_language_codes()
+            if self.subsManager.settings["subs_target_language_code"]:
+                sub_langs.append(self.subsManager.settings["subs_target_language_code"])
             ytdl_opts += ',sub-lang="%s"' % ",".join(sub_langs)
         self.default_argv += [ytdl_opts]
 
@@ -588,6 +1013,7 @@ class MPVMonitor(MPVInterSubs):
         self.audio_ffmpeg_id = 0
         self.sub_id: SubId = "auto"
         self.audio_delay = 0.0
+        self.frame_drops = 0
 
         self.set_property("include", self.mpvConf)
 
@@ -618,6 +1044,20 @@ class MPVMonitor(MPVInterSubs):
             self.msgHandler.create_anki_card.emit(
                 word, float(timePos), float(timeStart), float(timeEnd), subText
             )
+            return
+        m = re.match(r"^\[mpv2anki-bulk\] ([^#]+) # ([^#]+)$", statusMsg)
+        if m:
+            timeStart, timeEnd = m.groups()
+            self.msgHandler.create_anki_cards.emit(float(timeStart), float(timeEnd))
+
+    def on_property_core_idle(self, idle: Any = None) -> None:
+        # Time only advances when the player isn't paused, buffering or idle
+        media_scheduler.set_playing(self, idle is False)
+
+    def on_property_frame_drop_count(self, frame_drops: Any = None) -> None:
+        if isinstance(frame_drops, int) and frame_drops > self.frame_drops:
+            media_scheduler.frames_dropped(self)
+        self.frame_drops = frame_drops or 0
 
     def on_property_aid(self, audio_id: Any = None) -> None:
         self.audio_id = audio_id
@@ -635,6 +1075,10 @@ class MPVMonitor(MPVInterSubs):
                     break
         else:
             self.audio_ffmpeg_id = int(self.audio_id) - 1
+        # Switch the decoded track once the file is loaded
+        source = self.subsManager.pcm_source
+        if source is not None and audio_id not in (None, False, "no"):
+            self.subsManager.cache_audio(source[0], self.audio_ffmpeg_id)
 
     def on_property_sid(self, sub_id: SubId = None) -> None:
         self.sub_id = sub_id if sub_id is not False else "no"
@@ -646,12 +1090,13 @@ class MPVMonitor(MPVInterSubs):
         self.audio_delay = round(float(val), 3)
 
     def on_start_file(self, msg: Any) -> None:
-        self.filePath = self.get_property("path")
-        self.subsManager.init(self.filePath)
-        if self.subsManager.subsPath:
-            self.command("sub-add", self.subsManager.subsPath)
-        if self.subsManager.translationsPath:
-            self.command("sub-add", self.subsManager.translationsPath)
+        self.filePath = filePath = self.get_property("path")
+
+        def on_track_ready(subsPath: str) -> None:
+            mw.taskman.run_on_main(lambda: self.add_subtitles(filePath, subsPath))
+
+        self.subsManager.load(filePath, on_track_ready)
+        self.subsManager.prefetch(self.next_files())
         self.msgHandler.update_file_path.emit(self.filePath)
         if not self.get_property("vo-configured"):
             self.set_property("force-window", "yes")
@@ -660,7 +1105,52 @@ class MPVMonitor(MPVInterSubs):
         if audio_delay:
             self.set_property("audio-delay", audio_delay)
 
+    def next_files(self) -> List[str]:
+        try:
+            pos = int(self.get_property("playlist-pos"))
+            count = int(self.get_property("playlist-count"))
+            return [
+                self.get_property("playlist/%d/filename" % i)
+                for i in range(
+                    max(pos + 1, 0),
+                    min(count, pos + 1 + self.subsManager.prefetch_limit),
+                )
+            ]
+        except MPVCommandError:
+            return []
+
+    def on_file_loaded(self, msg: Any) -> None:
+        if "://" in self.filePath:
+            return
+        if self.subsManager.keyframes_enabled():
+            self.subsManager.index_keyframes(self.filePath)
+        aid = self.get_property("aid")
+        if aid in (None, False, "no"):
+            return
+        self.on_property_aid(aid)
+        filePath = self.filePath
+
+        def on_synced(delay: float) -> None:
+            mw.taskman.run_on_main(lambda: self.set_sub_delay(filePath, delay))
+
+        if self.subsManager.audio_analysis_enabled():
+            self.subsManager.analyze_audio(filePath, self.audio_ffmpeg_id, on_synced)
+        if self.subsManager.audio_cache_enabled():
+            self.subsManager.cache_audio(filePath, self.audio_ffmpeg_id)
+
+    def set_sub_delay(self, filePath: str, delay: float) -> None:
+        # Don't override a delay that was set by hand in the meantime
+        if filePath == self.filePath and self.subsManager.sub_delay == 0:
+            self.set_property("sub-delay", delay)
+            self.command("show-text", "Subtitles synced to audio (%+.2fs)" % delay)
+
+    def add_subtitles(self, filePath: str, subsPath: str) -> None:
+        if filePath == self.filePath:
+            self.command("sub-add", subsPath)
+
     def on_shutdown(self, msg: Any = None) -> None:
+        media_scheduler.set_playing(self, False)
+        self.subsManager.shutdown()
         try:
             self.close()
         except Exception:
@@ -668,6 +1158,198 @@ class MPVMonitor(MPVInterSubs):
             pass
 
 
+class ChangeNotifier:
+    """Tells Anki's screens what changed in the collection, at most once an interval.
+
+    Changes made in quick succession, like the notes of cards mined one after
+    another, are merged, so each screen refreshes what they affect once
+    instead of the main window being reset for every card. Screens that
+    aren't focused, as when mining from the player, refresh when they are.
+    """
+
+    interval = 500
+
+    def __init__(self) -> None:
+        self.changes: Optional[OpChanges] = None
+
+    def notify(self, changes: OpChanges) -> None:
+        if self.changes is None:
+            self.changes = OpChanges()
+            QTimer.singleShot(self.interval, self.flush)
+        # Fields are flags, so merging sets each that either has set
+        self.changes.MergeFrom(changes)
+
+    def flush(self) -> None:
+        changes, self.changes = self.changes, None
+        # The profile may have been closed in the meantime
+        if changes is not None and mw.col is not None:
+            gui_hooks.operation_did_execute(changes, None)
+            # As Anki does after its operations, so Undo offers what was just added
+            mw.update_undo_actions()
+
+
+change_notifier = ChangeNotifier()
+
+
+def first_field_key(value: str) -> str:
+    # What the collection compares to find duplicates
+    return strip_html_media(value).strip()
+
+
+def line_key(line: str) -> str:
+    # Lines differing only in markup, spacing or case are the same sentence
+    return " ".join(strip_html_media(line).split()).casefold()
+
+
+class NoteIndex:
+    """The notes of a note type by first field and by line, for the session.
+
+    Loaded once with a single query, so cards that would be duplicates are
+    told apart before any of their subtitles or media are looked at, without
+    asking the collection for each. Notes added by the session are added to
+    it; notes found in it are checked to still exist, as they may have been
+    deleted since.
+    """
+
+    def __init__(self, model: Dict[str, Any], line_fields: Sequence[str]) -> None:
+        self.mid = model["id"]
+        names = [field["name"] for field in model["flds"]]
+        self.line_ords = [names.index(name) for name in line_fields if name in names]
+        self.by_first_field: Dict[str, Set[int]] = {}
+        self.by_line: Dict[str, Set[int]] = {}
+
+    def load(self) -> None:
+        for note_id, fields in mw.col.db.all(
+            "select id, flds from notes where mid = ?", self.mid
+        ):
+            self.add(note_id, fields.split("\x1f"))
+
+    def add(self, note_id: int, fields: Sequence[str]) -> None:
+        key = first_field_key(fields[0])
+        if key:
+            self.by_first_field.setdefault(key, set()).add(note_id)
+        for idx in self.line_ords:
+            key = line_key(fields[idx])
+            if key:
+                self.by_line.setdefault(key, set()).add(note_id)
+
+    def existing(self, note_ids: Set[int]) -> Set[int]:
+        """Forget the notes that were deleted, and return the others."""
+        if note_ids:
+            found = set(
+                mw.col.db.list(
+                    "select id from notes where id in %s" % ids2str(note_ids)
+                )
+            )
+            note_ids.intersection_update(found)
+        return note_ids
+
+    def is_duplicate(self, first_field: str) -> bool:
+        key = first_field_key(first_field)
+        return bool(key) and bool(self.existing(self.by_first_field.get(key, set())))
+
+    def has_line(self, line: str) -> bool:
+        return bool(self.existing(self.by_line.get(line_key(line), set())))
+
+
+class NoteQueue:
+    """Adds notes of cards mined in quick succession together, in one transaction.
+
+    Queued notes are added an interval after the first of them, or as soon as
+    there are enough of them. Notes that would be duplicates of queued ones
+    can be told apart before they're queued, as the collection doesn't know
+    about those yet.
+    """
+
+    interval = 300
+    max_size = 50
+
+    def __init__(self) -> None:
+        self.queue: List[Tuple[Note, str, Callable[[Note, bool], None]]] = []
+        self.keys: Set[Tuple[int, str]] = set()
+
+    def key(self, note: Note) -> Tuple[int, str]:
+        return note.mid, first_field_key(note.fields[0])
+
+    def is_duplicate(self, note: Note) -> bool:
+        return self.key(note) in self.keys
+
+    def add(
+        self, note: Note, deck: str, on_added: Callable[[Note, bool], None]
+    ) -> None:
+        """Queue a note to be added to a deck.
+
+        on_added is called once it is, or couldn't be, with whether it was.
+        """
+        if not self.queue:
+            QTimer.singleShot(self.interval, self.flush)
+        self.queue.append((note, deck, on_added))
+        self.keys.add(self.key(note))
+        if len(self.queue) >= self.max_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Add the queued notes now.
+
+        Notes that can't be added, e.g. because their deck can't be created,
+        are dropped, so they don't keep the others from being added.
+        """
+        queue, self.queue = self.queue, []
+        self.keys.clear()
+        if not queue or mw.col is None:
+            return
+        deck_ids: Dict[str, DeckId] = {}
+
+        def deck_id(deck: str) -> DeckId:
+            if deck not in deck_ids:
+                deck_ids[deck] = mw.col.decks.id(deck)
+            return deck_ids[deck]
+
+        added: List[bool] = []
+        changes: Optional[OpChanges] = None
+        if AddNoteRequest is not None:
+            try:
+                requests = [
+                    AddNoteRequest(note, deck_id(deck)) for note, deck, _ in queue
+                ]
+                changes = mw.col.add_notes(  # type: ignore[attr-defined, unused-ignore]
+                    requests
+                )
+                added = [True] * len(queue)
+            except Exception:
+                # None were added; they're added one by one to find the culprits
+                pass
+        if not added:
+            # One undo step for all of them, like add_notes()
+            undo_entry = mw.col.add_custom_undo_entry(tr.actions_add_note())
+            for note, deck, _ in queue:
+                try:
+                    mw.col.add_note(note, deck_id(deck))
+                    added.append(True)
+                except Exception:
+                    added.append(False)
+            changes = mw.col.merge_undo_entries(undo_entry)
+        if any(added) and changes is not None:
+            change_notifier.notify(changes)
+        for (note, _, on_added), ok in zip(queue, added):
+            on_added(note, ok)
+
+
+note_queue = NoteQueue()
+
+
+class CardBatch:
+    """Media and counts of cards created together, to be made and reported once."""
+
+    def __init__(self) -> None:
+        self.subprocess_calls: List[MediaJob] = []
+        self.clips: List[Clip] = []
+        self.added = 0
+        self.duplicates = 0
+        # Cards added with a line already in other cards
+        self.repeated_lines = 0
+
+
 class AnkiHelper(QObject):
     def __init__(
         self,
@@ -682,6 +1364,7 @@ class AnkiHelper(QObject):
 
         self.msgHandler = MessageHandler()
         qconnect(self.msgHandler.create_anki_card, self.createAnkiCard)
+        qconnect(self.msgHandler.create_anki_cards, self.createAnkiCards)
         qconnect(self.msgHandler.update_file_path, self.updateFilePath)
 
         self.mpvConf = os.path.join(
@@ -702,6 +1385,11 @@ class AnkiHelper(QObject):
         self.popenEnv = popenEnv
 
         self.initFieldsMapping()
+        self.noteIndex = NoteIndex(
+            mw.col.models.by_name(self.settings["model"]),
+            self.fieldsMap["model"].get("Line", []),
+        )
+        self.noteIndex.load()
 
         addHook("unloadProfile", self.mpvManager.on_shutdown)
 
@@ -715,6 +1403,17 @@ class AnkiHelper(QObject):
             fieldsMapDefault[v].append(k)
         self.fieldsMap["model"] = fieldsMapDefault
 
+    def first_field_value(
+        self, model: Dict[str, Any], noteFields: Dict[str, str]
+    ) -> str:
+        """Return what the first field of the note will be, as far as it's known."""
+        first = model["flds"][0]["name"]
+        value = ""
+        for k, v in self.fieldsMap["model"].items():
+            if first in v and noteFields.get(k):
+                value = noteFields[k]
+        return value
+
     def updateFilePath(self, filePath: str) -> None:
         self.filePath = filePath
         if "://" not in self.filePath:
@@ -725,8 +1424,53 @@ class AnkiHelper(QObject):
     def createAnkiCard(
         self, word: str, timePos: float, timeStart: float, timeEnd: float, subText: str
     ) -> None:
+        loading = self.subsManager.loading
+        if not loading.done():
+            # Create the card once the subtitles are there instead of without them
+            self.mpvManager.command("show-text", "Loading subtitles...")
+            loading.add_done_callback(
+                lambda _: mw.taskman.run_on_main(
+                    lambda: self.addNewCard(word, timePos, timeStart, timeEnd, subText)
+                )
+            )
+            return
         self.addNewCard(word, timePos, timeStart, timeEnd, subText)
 
+    def createAnkiCards(self, timeStart: float, timeEnd: float) -> None:
+        """Create a card for each subtitle between timeStart and timeEnd, or in the whole file."""
+        loading = self.subsManager.loading
+        if not loading.done():
+            self.mpvManager.command("show-text", "Loading subtitles...")
+            loading.add_done_callback(
+                lambda _: mw.taskman.run_on_main(
+                    lambda: self.createAnkiCards(timeStart, timeEnd)
+                )
+            )
+            return
+        sub_ids = self.subsManager.get_subtitle_ids(timeStart, timeEnd)
+        if not sub_ids:
+            self.mpvManager.command("show-text", "Error: No subtitles to add.")
+            return
+        if timeStart >= 0 and timeEnd > timeStart:
+            where = "between %s and %s" % (
+                secondsToTimestamp(timeStart),
+                secondsToTimestamp(timeEnd),
+            )
+        else:
+            where = "in %s" % os.path.basename(self.filePath)
+        if not askUser(
+            "Create %d cards from the subtitles %s?" % (len(sub_ids), where), parent=mw
+        ):
+            return
+        self.addNewCards(sub_ids)
+
+    def pad_clip(
+        self, start: float, end: float, pad_start: float, pad_end: float
+    ) -> Tuple[float, float]:
+        return self.subsManager.pad_clip(
+            start, end, pad_start, pad_end, self.mpvManager.audio_delay
+        )
+
     def format_filename(self, filename: str) -> str:
         if not self.is_local_file or re.search(r'[\\/:"*?<>|]+', filename):
             filename = sha1(filename.encode("utf-8")).hexdigest()
@@ -736,13 +1480,19 @@ class AnkiHelper(QObject):
             filename = filename.strip()
         return filename
 
+    def media_key(self, *params: Any) -> str:
+        """Key of the media made from the current file with the given parameters."""
+        use_ffmpeg = not self.settings["use_mpv"] and bool(ffmpeg_executable)
+        return media_index.key(self.filePath, use_ffmpeg, *params)
+
     def subprocess_image(
         self,
         source: str,
         timePos: float,
-        subprocess_calls: List[list[str]],
+        subprocess_calls: List[MediaJob],
         sub: SubId = "no",
         suffix: str = "",
+        clips: Optional[List[Clip]] = None,
     ) -> str:
         image = "%s_%s%s.jpg" % (
             self.format_filename(source),
@@ -750,12 +1500,33 @@ class AnkiHelper(QObject):
             suffix,
         )
         imagePath = os.path.join(mw.col.media.dir(), image)
-        if not self.settings["use_mpv"] and ffmpeg_executable and sub is None:
+        key = self.media_key(
+            "image",
+            timePos,
+            sub,
+            self.subsManager.sub_delay,
+            self.settings["image_width"],
+            self.settings["image_height"],
+        )
+        if not media_index.claim(imagePath, key):
+            return image
+        use_ffmpeg = not self.settings["use_mpv"] and ffmpeg_executable
+        if clips is not None and use_ffmpeg and sub == "no":
+            # Taken from the same decode as the clips of the cards
+            clips.append(
+                Clip(timePos, timePos + IMAGE_WINDOW, imagePath, key=key, image=True)
+            )
+            return image
+        if clips is None and self.screenshot_image(imagePath, timePos, sub):
+            media_index.record(imagePath, key)
+            return image
+        outputPath = temp_path(imagePath)
+        if use_ffmpeg and sub is None:
             argv = ["ffmpeg", "-y"]
             argv += ["-ss", secondsToTimestamp(timePos)]
             argv += ["-i", self.filePath]
             argv += ["-vframes", "1"]
-            argv += [imagePath]
+            argv += [outputPath]
         else:
             argv = [self.mpvExecutable, self.filePath]
             argv += ["--include=%s" % self.mpvConf]
@@ -772,10 +1543,60 @@ class AnkiHelper(QObject):
             ]
             argv += ["--vf-add=format=fmt=yuvj422p"]
             argv += ["--ovc=mjpeg"]
-            argv += ["--o=%s" % imagePath]
-        subprocess_calls.append(argv)
+            argv += ["--o=%s" % outputPath]
+        subprocess_calls.append(
+            MediaJob(PRIORITY_IMAGE, argv, [MediaOutput(outputPath, imagePath, key)])
+        )
         return image
 
+    def screenshot_image(self, imagePath: str, timePos: float, sub: SubId) -> bool:
+        """Save the frame the player is showing as the image at timePos, if it still is.
+
+        This needs no decoding, so it's much quicker than subprocess_image().
+        """
+        if not self.settings.get("live_screenshots", True):
+            return False
+        try:
+            if abs(float(self.mpvManager.get_property("time-pos")) - timePos) > 0.5:
+                return False
+            if sub == "no":
+                mode = "video"
+            elif self.mpvManager.get_property("sub-visibility"):
+                mode = "subtitles"
+            else:
+                # Hidden subtitles aren't in screenshots
+                return False
+            shotPath = temp_path(imagePath)
+            self.mpvManager.command("screenshot-to-file", shotPath, mode)
+        except (MPVCommandError, TypeError, ValueError):
+            return False
+
+        image = QImage(shotPath)
+        if not image.isNull():
+            width, height = scaledSize(
+                image.width(),
+                image.height(),
+                self.settings["image_width"],
+                self.settings["image_height"],
+            )
+            if (width, height) != (image.width(), image.height()):
+                image = image.scaled(
+                    width,
+                    height,
+                    Qt.AspectRatioMode.IgnoreAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation,
+                )
+                if not image.save(shotPath):
+                    image = QImage()
+        try:
+            if image.isNull():
+                os.remove(shotPath)
+                return False
+            os.replace(shotPath, imagePath)
+        except OSError:
+            return False
+        return True
+
     def subprocess_audio(
         self,
         source: str,
@@ -783,7 +1604,8 @@ class AnkiHelper(QObject):
         sub_end: float,
         aid: int,
         aid_ff: int,
-        subprocess_calls: List[List[str]],
+        subprocess_calls: List[MediaJob],
+        clips: List[Clip],
     ) -> str:
         audio = "%s_%s-%s.%s" % (
             self.format_filename(source),
@@ -792,24 +1614,40 @@ class AnkiHelper(QObject):
             self.settings["audio_ext"],
         )
         audioPath = os.path.join(mw.col.media.dir(), audio)
+        # The clip is of what's heard with the player's audio delay, however it's cut
+        audio_delay = self.mpvManager.audio_delay
+        key = self.media_key("audio", sub_start, sub_end, aid, aid_ff, audio_delay)
+        if not media_index.claim(audioPath, key):
+            return audio
+        pcm = self.subsManager.cut_audio(
+            aid_ff, sub_start - audio_delay, sub_end - audio_delay
+        )
+        if pcm is not None:
+            # Only encoding is left to do
+            outputPath = temp_path(audioPath)
+            subprocess_calls.append(
+                MediaJob(
+                    PRIORITY_AUDIO,
+                    audio_cache.encode_argv(ffmpeg_executable, outputPath),
+                    [MediaOutput(outputPath, audioPath, key)],
+                    pcm,
+                )
+            )
+            return audio
         if not self.settings["use_mpv"] and ffmpeg_executable:
-            argv = ["ffmpeg", "-y"]
-            argv += ["-ss", secondsToTimestamp(sub_start)]
-            argv += ["-i", self.filePath]
-            argv += ["-t", secondsToTimestamp(sub_end - sub_start)]
-            argv += ["-map", "0:a:%d" % aid_ff]
-            argv += [
-                "-af",
-                "afade=t=in:st={:.3f}:d={:.3f},afade=t=out:st={:.3f}:d={:.3f}".format(
-                    0, 0.25, sub_end - sub_start - 0.25, 0.25
-                ),
-            ]
-            argv += ["-vn"]
-            argv += [audioPath]
+            # Cut together with the card's other clips by plan_clips()
+            clips.append(
+                Clip(
+                    max(0.0, sub_start - audio_delay),
+                    sub_end - audio_delay,
+                    audioPath,
+                    key=key,
+                )
+            )
+            return audio
         else:
             argv = [self.mpvExecutable, self.filePath]
             argv += ["--include=%s" % self.mpvConf]
-            audio_delay = self.mpvManager.audio_delay
             sub_start -= audio_delay
             sub_end -= audio_delay
             argv += [
@@ -822,8 +1660,11 @@ class AnkiHelper(QObject):
                 "--af=afade=t=in:st=%s:d=%s,afade=t=out:st=%s:d=%s"
                 % (sub_start, 0.25, sub_end - 0.25, 0.25)
             ]
-            argv += ["--o=%s" % audioPath]
-        subprocess_calls.append(argv)
+            outputPath = temp_path(audioPath)
+            argv += ["--o=%s" % outputPath]
+        subprocess_calls.append(
+            MediaJob(PRIORITY_AUDIO, argv, [MediaOutput(outputPath, audioPath, key)])
+        )
         return audio
 
     def get_video_filename(
@@ -837,6 +1678,17 @@ class AnkiHelper(QObject):
         )
         return video
 
+    def copy_start(self, start: float, video_format: str) -> Optional[float]:
+        """Return the keyframe to cut a video clip from without re-encoding, if any."""
+        keyframes = self.subsManager.keyframes
+        if keyframes is None or not self.subsManager.keyframes_enabled():
+            return None
+        return copy_start(keyframes, start, video_format)
+
+    def encoder_options(self, video_format: str) -> Optional[Dict[str, str]]:
+        """Options of the video encoder of a format, if the encoders were tuned."""
+        return self.settings.get("encoder_options", {}).get(video_format)
+
     def subprocess_video(
         self,
         source: str,
@@ -845,32 +1697,50 @@ class AnkiHelper(QObject):
         aid: int,
         aid_ff: int,
         video_format: str,
-        subprocess_calls: List[List[str]],
+        subprocess_calls: List[MediaJob],
+        clips: List[Clip],
     ) -> str:
         video = self.get_video_filename(source, sub_start, sub_end, video_format)
         videoPath = os.path.join(mw.col.media.dir(), video)
+        keyframe = self.copy_start(sub_start, video_format)
+        # Clips that are copied aren't encoded, so the encoder doesn't matter
+        options: Optional[Dict[str, str]] = None
+        if keyframe is None:
+            options = (
+                self.encoder_options(video_format) or DEFAULT_OPTIONS[video_format]
+            )
+        key = self.media_key(
+            "video",
+            sub_start,
+            sub_end,
+            aid,
+            aid_ff,
+            self.mpvManager.audio_delay,
+            self.settings["video_width"],
+            self.settings["video_height"],
+            keyframe,
+            options,
+        )
+        if not media_index.claim(videoPath, key):
+            return video
+        if keyframe is not None:
+            clips.append(
+                Clip(keyframe, sub_end, videoPath, video=True, key=key, copy=True)
+            )
+            return video
         if not self.settings["use_mpv"] and ffmpeg_executable:
-            argv = ["ffmpeg", "-y"]
-            argv += ["-ss", secondsToTimestamp(sub_start)]
-            argv += ["-i", self.filePath]
-            argv += ["-t", secondsToTimestamp(sub_end - sub_start)]
-            argv += ["-map", "0:v:0"]
-            argv += ["-map", "0:a:%d" % aid_ff]
-            argv += [
-                "-af",
-                "afade=t=in:st={:.3f}:d={:.3f},afade=t=out:st={:.3f}:d={:.3f}".format(
-                    0, 0.25, sub_end - sub_start - 0.25, 0.25
-                ),
-            ]
-            argv += [
-                "-vf",
-                "scale=%d:%d"
-                % (self.settings["video_width"], self.settings["video_height"]),
-            ]
-            if video_format == "webm":
-                argv += ["-c:v", "libvpx-vp9"]
-                argv += ["-b:v", "1400K", "-threads", "8", "-speed", "2", "-crf", "23"]
-            argv += [videoPath]
+            # Cut together with the card's other clips by plan_clips()
+            clips.append(
+                Clip(
+                    sub_start,
+                    sub_end,
+                    videoPath,
+                    video=True,
+                    key=key,
+                    options=tuple(ffmpeg_options(options)),
+                )
+            )
+            return video
         else:
             argv = [self.mpvExecutable, self.filePath]
             argv += ["--include=%s" % self.mpvConf]
@@ -890,15 +1760,25 @@ class AnkiHelper(QObject):
                 "--vf-add=lavfi-scale=%s:%s"
                 % (self.settings["video_width"], self.settings["video_height"])
             ]
+            tuned = self.encoder_options(video_format)
             if video_format == "webm":
                 argv += ["--ovc=libvpx-vp9"]
-                argv += ["--ovcopts=b=1400K,threads=4,crf=23,qmin=0,qmax=36,speed=2"]
-            argv += ["--o=%s" % videoPath]
-        subprocess_calls.append(argv)
+                argv += [
+                    "--ovcopts=b=1400K,crf=23,qmin=0,qmax=36,%s"
+                    % (mpv_options(tuned) if tuned else "threads=4,speed=2")
+                ]
+            elif tuned:
+                argv += ["--ovcopts=%s" % mpv_options(tuned)]
+            outputPath = temp_path(videoPath)
+            argv += ["--o=%s" % outputPath]
+        priority = PRIORITY_VP9 if video_format == "webm" else PRIORITY_VIDEO
+        subprocess_calls.append(
+            MediaJob(priority, argv, [MediaOutput(outputPath, videoPath, key)])
+        )
         return video
 
     # anki.utils.call() with bundle libs if mpv is packaged
-    def call(self, argv: List[str]) -> None:
+    def popen_kwargs(self) -> Dict[str, Any]:
         if is_win:
             si = subprocess.STARTUPINFO()  # type: ignore[attr-defined, unused-ignore]
             try:
@@ -909,17 +1789,79 @@ class AnkiHelper(QObject):
         else:
             si = None
 
-        subprocess.Popen(argv, startupinfo=si, env=self.popenEnv)
+        return {"startupinfo": si, "env": self.popenEnv}
+
+    def on_media_ready(self, ok: bool) -> None:
+        try:
+            if ok:
+                self.mpvManager.command("show-text", "Media ready.")
+            else:
+                self.mpvManager.command(
+                    "show-text", "Error: Some media couldn't be created."
+                )
+        except Exception:
+            # mpv may have been closed while the media was being created
+            pass
+
+    def submit_media(
+        self, subprocess_calls: List[MediaJob], clips: Sequence[Clip]
+    ) -> None:
+        if clips:
+            subprocess_calls = subprocess_calls + plan_clips(
+                ffmpeg_executable,
+                self.filePath,
+                clips,
+                self.mpvManager.audio_ffmpeg_id,
+                (self.settings["video_width"], self.settings["video_height"]),
+                (self.settings["image_width"], self.settings["image_height"]),
+            )
+        for job in subprocess_calls:
+            if os.environ.get("DEBUG"):
+                p = job.argv
+                p_debug = p[:1] + ["-v"] + p[1:]
+                print(
+                    "DEBUG:",
+                    " ".join(['"{}"'.format(s) if " " in s else s for s in p_debug]),
+                )
+        if subprocess_calls:
+            media_scheduler.submit(
+                subprocess_calls,
+                lambda ok: mw.taskman.run_on_main(lambda: self.on_media_ready(ok)),
+                self.popen_kwargs(),
+            )
+
+    def addNewCards(self, sub_ids: Sequence[int]) -> None:
+        """Create a card for each subtitle, with the media of all cut in one pass over the file."""
+        batch = CardBatch()
+        for sub_id in sub_ids:
+            start, end, subText = self.subsManager.loaded.cues.cue(sub_id)
+            timePos = (start + end) / 2 + self.subsManager.sub_delay
+            self.addNewCard("", timePos, -1, -1, subText, batch, sub_id)
+        note_queue.flush()
+        self.submit_media(batch.subprocess_calls, batch.clips)
+        msg = "Added %d cards." % batch.added
+        if batch.duplicates:
+            msg += " %d already existed." % batch.duplicates
+        if batch.repeated_lines:
+            msg += " %d have lines of other cards." % batch.repeated_lines
+        self.mpvManager.command("show-text", msg)
 
     def addNewCard(
-        self, word: str, timePos: float, timeStart: float, timeEnd: float, subText: str
+        self,
+        word: str,
+        timePos: float,
+        timeStart: float,
+        timeEnd: float,
+        subText: str,
+        batch: Optional[CardBatch] = None,
+        cue_id: Optional[int] = None,
     ) -> None:
         noteFields = {k: "" for k in self.configManager.getFields()}
 
         model = mw.col.models.by_name(self.settings["model"])
 
         noteFields["Word"] = word
-        if self.configManager.onClickDict:
+        if self.configManager.onClickDict and word:
             self.configManager.onClickDict.fill_fields(word, noteFields)
 
         source = os.path.basename(self.filePath)
@@ -929,8 +1871,6 @@ class AnkiHelper(QObject):
         path = os.path.basename(self.filePath)
         noteFields["Path"] = self.filePath
 
-        note = mw.col.new_note(model)
-
         subTranslation = ""
 
         subText_before = ""
@@ -953,13 +1893,15 @@ class AnkiHelper(QObject):
                 return
             timeEnd = timePos
 
-        if timeStart >= 0:
+        if cue_id is not None:
+            sub_id: Optional[int] = cue_id
+        elif timeStart >= 0:
             subTime = timeStart + (timeEnd - timeStart) / 2
             sub_id = self.subsManager.get_subtitle_id(subTime)
         else:
             sub_id = self.subsManager.get_subtitle_id(timePos)
 
-        if timeStart == -1 and timeEnd == -1:  # mpv >= v0.30.0
+        if timeStart == -1 and timeEnd == -1 and cue_id is None:  # mpv >= v0.30.0
             try:
                 sub_start = float(self.mpvManager.get_property("sub-start"))
                 sub_end = float(self.mpvManager.get_property("sub-end"))
@@ -967,36 +1909,23 @@ class AnkiHelper(QObject):
                 # Temporary workaround for some sites (e.g. NBC)
                 sub_start = timePos - 5
                 sub_end = timePos + 5
-            sub_start += -sub_pad_start + self.subsManager.sub_delay
-            sub_end += sub_pad_end + self.subsManager.sub_delay
+            sub_start, sub_end = self.pad_clip(
+                sub_start + self.subsManager.sub_delay,
+                sub_end + self.subsManager.sub_delay,
+                sub_pad_start,
+                sub_pad_end,
+            )
 
         if sub_id is not None:
             sub_start, sub_end, subText = self.subsManager.get_subtitle(sub_id)
-            subTranslation = self.subsManager.get_subtitle(sub_id, translation=True)[2]
-
-            (
-                prev_sub_start,
-                prev_sub_end,
-                subText_before,
-            ) = self.subsManager.get_prev_subtitle(sub_id)
-            (
-                next_sub_start,
-                next_sub_end,
-                subText_after,
-            ) = self.subsManager.get_next_subtitle(sub_id)
-
-            subTranslation_before = self.subsManager.get_prev_subtitle(
-                sub_id, translation=True
-            )[2]
-            subTranslation_after = self.subsManager.get_next_subtitle(
-                sub_id, translation=True
-            )[2]
-
-            sub_start += -sub_pad_start + self.subsManager.sub_delay
-            sub_end += sub_pad_end + self.subsManager.sub_delay
-
-            prev_sub_start += -sub_pad_start + self.subsManager.sub_delay
-            next_sub_end += sub_pad_end + self.subsManager.sub_delay
+            speech_start = sub_start + self.subsManager.sub_delay
+            speech_end = sub_end + self.subsManager.sub_delay
+            sub_start, sub_end = self.pad_clip(
+                speech_start, speech_end, sub_pad_start, sub_pad_end
+            )
+            # The subtitles written for the clip are placed by the padding it got
+            sub_pad_start = speech_start - sub_start
+            sub_pad_end = sub_end - speech_end
 
         if timeStart >= 0 and timeEnd >= 0:
             sub_start = timeStart
@@ -1019,6 +1948,46 @@ class AnkiHelper(QObject):
 
         noteFields["Id"] = noteId
         noteFields["Line"] = subText
+
+        # Duplicates are told apart before the context and media of the card
+        if self.noteIndex.is_duplicate(self.first_field_value(model, noteFields)):
+            if batch is not None:
+                batch.duplicates += 1
+                return
+            self.mpvManager.command("show-text", "Error: Card already exists.")
+            return
+        repeated_line = self.settings.get(
+            "warn_repeated_lines", False
+        ) and self.noteIndex.has_line(subText)
+
+        if sub_id is not None:
+            subTranslation = self.subsManager.get_subtitle(sub_id, translation=True)[2]
+
+            (
+                prev_sub_start,
+                prev_sub_end,
+                subText_before,
+            ) = self.subsManager.get_prev_subtitle(sub_id)
+            (
+                next_sub_start,
+                next_sub_end,
+                subText_after,
+            ) = self.subsManager.get_next_subtitle(sub_id)
+
+            subTranslation_before = self.subsManager.get_prev_subtitle(
+                sub_id, translation=True
+            )[2]
+            subTranslation_after = self.subsManager.get_next_subtitle(
+                sub_id, translation=True
+            )[2]
+
+            prev_sub_start, next_sub_end = self.pad_clip(
+                prev_sub_start + self.subsManager.sub_delay,
+                next_sub_end + self.subsManager.sub_delay,
+                self.settings["pad_start"] / 1000.0,
+                self.settings["pad_end"] / 1000.0,
+            )
+
         noteFields["Line: before"] = subText_before
         noteFields["Line: after"] = subText_after
         noteFields["Meaning: line"] = subTranslation
@@ -1027,7 +1996,8 @@ class AnkiHelper(QObject):
 
         noteFields["Time"] = secondsToTimestamp(timePos)
 
-        subprocess_calls: List[List[str]] = []
+        subprocess_calls: List[MediaJob] = []
+        clips: List[Clip] = []
 
         aid = cast(int, self.mpvManager.audio_id)
         aid_ff = self.mpvManager.audio_ffmpeg_id
@@ -1038,7 +2008,12 @@ class AnkiHelper(QObject):
         video = None
 
         if "Image" in fieldsMap:
-            image = self.subprocess_image(source, timePos, subprocess_calls)
+            image = self.subprocess_image(
+                source,
+                timePos,
+                subprocess_calls,
+                clips=clips if batch is not None else None,
+            )
             noteFields["Image"] = '<img src="%s" />' % image
 
         if "Image (with subtitles)" in fieldsMap:
@@ -1052,20 +2027,34 @@ class AnkiHelper(QObject):
         if sub_start >= 0 and sub_end >= 0:
             if "Audio" in fieldsMap:
                 audio = self.subprocess_audio(
-                    source, sub_start, sub_end, aid, aid_ff, subprocess_calls
+                    source, sub_start, sub_end, aid, aid_ff, subprocess_calls, clips
                 )
                 noteFields["Audio"] = "[sound:%s]" % audio
 
             if "Video" in fieldsMap or "Video (HTML5)" in fieldsMap:
                 video = self.subprocess_video(
-                    source, sub_start, sub_end, aid, aid_ff, "mp4", subprocess_calls
+                    source,
+                    sub_start,
+                    sub_end,
+                    aid,
+                    aid_ff,
+                    "mp4",
+                    subprocess_calls,
+                    clips,
                 )
                 noteFields["Video"] = "[sound:%s]" % video
                 noteFields["Video (HTML5)"] = video
 
             if "[webm] Video" in fieldsMap or "[webm] Video (HTML5)" in fieldsMap:
                 video = self.subprocess_video(
-                    source, sub_start, sub_end, aid, aid_ff, "webm", subprocess_calls
+                    source,
+                    sub_start,
+                    sub_end,
+                    aid,
+                    aid_ff,
+                    "webm",
+                    subprocess_calls,
+                    clips,
                 )
                 noteFields["[webm] Video"] = "[sound:%s]" % video
                 noteFields["[webm] Video (HTML5)"] = video
@@ -1073,7 +2062,13 @@ class AnkiHelper(QObject):
         if sub_id is not None:
             if "Audio (with context)" in fieldsMap:
                 audio = self.subprocess_audio(
-                    source, prev_sub_start, next_sub_end, aid, aid_ff, subprocess_calls
+                    source,
+                    prev_sub_start,
+                    next_sub_end,
+                    aid,
+                    aid_ff,
+                    subprocess_calls,
+                    clips,
                 )
                 noteFields["Audio (with context)"] = "[sound:%s]" % audio
 
@@ -1091,6 +2086,7 @@ class AnkiHelper(QObject):
                     aid_ff,
                     "mp4",
                     subprocess_calls,
+                    clips,
                 )
                 noteFields["Video (with context)"] = "[sound:%s]" % video
                 noteFields["Video (HTML5 with context)"] = video
@@ -1108,6 +2104,7 @@ class AnkiHelper(QObject):
                     aid_ff,
                     "webm",
                     subprocess_calls,
+                    clips,
                 )
                 noteFields["[webm] Video (with context)"] = "[sound:%s]" % video
                 noteFields["[webm] Video (HTML5 with context)"] = video
@@ -1119,37 +2116,71 @@ class AnkiHelper(QObject):
                 subtitles = os.path.splitext(video)[0] + ".srt"
                 subtitlesPath = os.path.join(mw.col.media.dir(), subtitles)
                 noteFields["Video Subtitles"] = "[sound:%s]" % subtitles
+                # Clips that aren't re-encoded start early, at a keyframe
+                keyframe = self.copy_start(sub_start, os.path.splitext(video)[1][1:])
+                if keyframe is not None:
+                    sub_pad_start += sub_start - keyframe
+                    sub_start = keyframe
 
+        note = mw.col.new_note(model)
         for k, v in fieldsMap.items():
             val = noteFields.get(k, None)
             if val:
                 for field in v:
                     note[field] = val
 
-        ret = note.dupeOrEmpty()
-        if ret == 2:
+        # The first field may only be known now if it holds media
+        if self.noteIndex.is_duplicate(note.fields[0]) or note_queue.is_duplicate(note):
+            for job in subprocess_calls:
+                for output in job.outputs:
+                    media_index.release(output.path, output.key)
+            for clip in clips:
+                media_index.release(clip.path, clip.key)
+            if batch is not None:
+                batch.duplicates += 1
+                return
             self.mpvManager.command("show-text", "Error: Card already exists.")
             return
 
-        for p in subprocess_calls:
-            if os.environ.get("DEBUG"):
-                p_debug = p[:1] + ["-v"] + p[1:]
-                print(
-                    "DEBUG:",
-                    " ".join(['"{}"'.format(s) if " " in s else s for s in p_debug]),
-                )
-            self.call(p)
+        if batch is not None:
+            # Cut with the media of the other cards once they're all added
+            batch.subprocess_calls += subprocess_calls
+            batch.clips += clips
+        else:
+            self.submit_media(subprocess_calls, clips)
 
         if sub_id is not None and "Video Subtitles" in fieldsMap:
             self.subsManager.write_subtitles(
                 sub_start, sub_end, sub_pad_start, sub_pad_end, subtitlesPath
             )
-        did = mw.col.decks.id(self.settings["deck"])
-        mw.col.add_note(note, did)
-        if len(note.cards()) == 0:
-            self.mpvManager.command("show-text", "Error: No cards added.")
-        else:
-            if is_mac:
+        note_queue.add(
+            note,
+            self.settings["deck"],
+            lambda note, added: self.on_note_added(note, added, batch, repeated_line),
+        )
+
+    def on_note_added(
+        self,
+        note: Note,
+        added: bool,
+        batch: Optional[CardBatch] = None,
+        repeated_line: bool = False,
+    ) -> None:
+        if added:
+            self.noteIndex.add(note.id, note.fields)
+        if batch is not None:
+            if added and len(note.cards()) > 0:
+                batch.added += 1
+                batch.repeated_lines += repeated_line
+            return
+        try:
+            if not added or len(note.cards()) == 0:
+                self.mpvManager.command("show-text", "Error: No cards added.")
+            elif repeated_line:
+                self.mpvManager.command(
+                    "show-text", "Added. The line is already in another card."
+                )
+            elif is_mac:
                 self.mpvManager.command("expand-properties", "show-text", "Added.")
             else:
                 self.mpvManager.command(
@@ -1157,7 +2188,9 @@ class AnkiHelper(QObject):
                     "show-text",
                     "${osd-ass-cc/0}{\\fscx150\\fscy150}✔",
                 )
-        mw.reset()
+        except Exception:
+            # mpv may have been closed while the note was queued
+            pass
 
 
 class FieldMapping(QDialog):
@@ -1344,6 +2377,20 @@ class MainWindow(QDialog):
         self.useMPV.setChecked(self.settings["use_mpv"])
 
         self.audio_ext = QLineEdit(self.settings["audio_ext"])
+        self.cacheDecodedAudio = QCheckBox("Decode audio once")
+        self.cacheDecodedAudio.setChecked(
+            self.settings.get("cache_decoded_audio", True)
+        )
+        self.cacheDecodedAudio.setToolTip(
+            "Decode the audio track of local files once in the background and cut audio clips from it (requires NumPy and ffmpeg)"
+        )
+        self.warnRepeatedLines = QCheckBox("Warn about repeated lines")
+        self.warnRepeatedLines.setChecked(
+            self.settings.get("warn_repeated_lines", False)
+        )
+        self.warnRepeatedLines.setToolTip(
+            "Tell when a card is added with the same line as a card with a different Id, e.g. from another episode"
+        )
 
         icon = QIcon(os.path.join(os.path.dirname(__file__), "icons", "gears.png"))
 
@@ -1359,6 +2406,8 @@ class MainWindow(QDialog):
         grid.addWidget(self.useMPV, 1, 4)
         grid.addWidget(QLabel("File ext:"), 1, 0)
         grid.addWidget(self.audio_ext, 1, 1)
+        grid.addWidget(self.cacheDecodedAudio, 1, 2, 1, 2)
+        grid.addWidget(self.warnRepeatedLines, 2, 2, 1, 3)
         grid.setColumnStretch(4, 1)
 
         importGroup.setLayout(grid)
@@ -1376,6 +2425,13 @@ class MainWindow(QDialog):
             [self.settings["image_width"], self.settings["image_height"]],
             [-2, 10000, 2],
         )
+        self.liveScreenshots = QCheckBox("From player")
+        self.liveScreenshots.setChecked(self.settings.get("live_screenshots", True))
+        self.liveScreenshots.setToolTip(
+            "Take images from the player when it's showing the card's frame instead of decoding it again"
+        )
+        image_grid_layout = cast(QGridLayout, imageGroup.layout())
+        image_grid_layout.addWidget(self.liveScreenshots, 2, 0, 1, 3)
         (
             videoGroup,
             self.videoWidth,
@@ -1399,6 +2455,19 @@ class MainWindow(QDialog):
         avDelay.setRange(-2147483648, 2147483647)
         avDelay.setSingleStep(1)
         avDelay.setValue(self.settings["av_delay"])
+        self.fastVideoClips = QCheckBox("Fast clips")
+        self.fastVideoClips.setChecked(self.settings.get("fast_video_clips", False))
+        self.fastVideoClips.setToolTip(
+            "Cut video clips of local H.264, HEVC, VP9 and AV1 files without re-encoding when there's a keyframe up to a second before them. Such clips start a little early and aren't resized (requires ffmpeg)"
+        )
+        video_grid_layout.addWidget(self.fastVideoClips, 3, 0, 1, 3)
+        self.tuneEncodersButton = QPushButton("Tune Encoders")
+        self.tuneEncodersButton.setAutoDefault(False)
+        self.tuneEncodersButton.setToolTip(
+            "Measure the fastest settings of the video encoders on this computer that keep the quality and size of clips, and use them for this preset (requires ffmpeg)"
+        )
+        qconnect(self.tuneEncodersButton.clicked, self.onTuneEncoders)
+        video_grid_layout.addWidget(self.tuneEncodersButton, 4, 0, 1, 3)
 
         padGroup, self.padStart, self.padEnd = self.getTwoSpeenBoxesOptionsGroup(
             "Pad Timings",
@@ -1406,6 +2475,13 @@ class MainWindow(QDialog):
             [self.settings["pad_start"], self.settings["pad_end"]],
             [-2147483648, 2147483647, 1],
         )
+        self.snapToSilence = QCheckBox("Snap to silence")
+        self.snapToSilence.setChecked(self.settings.get("snap_to_silence", True))
+        self.snapToSilence.setToolTip(
+            "Move the ends of clips to the nearest quiet point within the padding of local files (requires NumPy and ffmpeg)"
+        )
+        pad_grid_layout = cast(QGridLayout, padGroup.layout())
+        pad_grid_layout.addWidget(self.snapToSilence, 2, 0, 1, 3)
         hbox.addWidget(imageGroup)
         hbox.addWidget(videoGroup)
         hbox.addWidget(padGroup)
@@ -1416,35 +2492,43 @@ class MainWindow(QDialog):
         grid3 = QGridLayout()
         grid3.addWidget(QLabel("In your target language:"), 0, 0)
         grid3.addWidget(QLabel("In your native language:"), 1, 0)
+        grid3.addWidget(QLabel("In a second native language:"), 2, 0)
         self.subsTargetLang = QComboBox()
         self.subsNativeLang = QComboBox()
+        self.subsSecondNativeLang = QComboBox()
         self.subsTargetLang.addItem("")
         self.subsNativeLang.addItem("")
+        self.subsSecondNativeLang.addItem("")
         for lang, lc in langs:
             self.subsTargetLang.addItem(lang)
             self.subsNativeLang.addItem(lang)
+            self.subsSecondNativeLang.addItem(lang)
         self.subsTargetLang.setCurrentIndex(
             self.subsTargetLang.findText(self.settings["subs_target_language"])
         )
         self.subsNativeLang.setCurrentIndex(
             self.subsNativeLang.findText(self.settings["subs_native_language"])
         )
+        self.subsSecondNativeLang.setCurrentIndex(
+            self.subsSecondNativeLang.findText(
+                self.settings.get("subs_second_native_language", "")
+            )
+        )
         grid3.addWidget(self.subsTargetLang, 0, 1)
         grid3.addWidget(self.subsNativeLang, 1, 1)
+        grid3.addWidget(self.subsSecondNativeLang, 2, 1)
         self.subsTargetLC = QLineEdit(self.settings["subs_target_language_code"])
         self.subsNativeLC = QLineEdit(self.settings["subs_native_language_code"])
-        self.subsTargetLC.setFixedWidth(24)
-        self.subsNativeLC.setFixedWidth(24)
-        self.subsTargetLC.setReadOnly(True)
-        self.subsNativeLC.setReadOnly(True)
-        self.subsTargetLC.setStyleSheet("QLineEdit{background: #f4f3f4;}")
-        self.subsNativeLC.setStyleSheet("QLineEdit{background: #f4f3f4;}")
-        self.subsTargetLC.setAlignment(
-            Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
-        )
-        self.subsNativeLC.setAlignment(
-            Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
+        self.subsSecondNativeLC = QLineEdit(
+            self.settings.get("subs_second_native_language_code", "")
         )
+        for lcEdit in (self.subsTargetLC, self.subsNativeLC, self.subsSecondNativeLC):
+            lcEdit.setFixedWidth(24)
+            lcEdit.setReadOnly(True)
+            lcEdit.setStyleSheet("QLineEdit{background: #f4f3f4;}")
+            lcEdit.setAlignment(
+                Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignVCenter
+            )
         qconnect(
             self.subsTargetLang.currentIndexChanged,
             lambda: self.chooseSubs(self.subsTargetLang, self.subsTargetLC),
@@ -1453,9 +2537,15 @@ class MainWindow(QDialog):
             self.subsNativeLang.currentIndexChanged,
             lambda: self.chooseSubs(self.subsNativeLang, self.subsNativeLC),
         )
+        qconnect(
+            self.subsSecondNativeLang.currentIndexChanged,
+            lambda: self.chooseSubs(self.subsSecondNativeLang, self.subsSecondNativeLC),
+        )
         grid3.addWidget(self.subsTargetLC, 0, 3)
         grid3.addWidget(self.subsNativeLC, 1, 3)
+        grid3.addWidget(self.subsSecondNativeLC, 2, 3)
         grid3.addWidget(QLabel(" (optional)"), 1, 4)
+        grid3.addWidget(QLabel(" (optional)"), 2, 4)
         grid3.addItem(
             QSpacerItem(40, 20, QSizePolicy.Policy.Maximum, QSizePolicy.Policy.Minimum),
             0,
@@ -1463,6 +2553,25 @@ class MainWindow(QDialog):
             1,
             2,
         )
+        self.clearSubsCacheButton = QPushButton("Clear Cache")
+        self.clearSubsCacheButton.setAutoDefault(False)
+        self.clearSubsCacheButton.setToolTip(
+            "Remove the processed subtitles and decoded audio that are kept to open videos and make cards faster"
+        )
+        qconnect(self.clearSubsCacheButton.clicked, self.onClearSubtitlesCache)
+        grid3.addWidget(self.clearSubsCacheButton, 3, 0)
+        self.subsAutoSync = QCheckBox("Fix timing of native-language subtitles")
+        self.subsAutoSync.setChecked(self.settings.get("subs_auto_sync", True))
+        self.subsAutoSync.setToolTip(
+            "Correct native-language subtitles from a different release that are offset or play at a different framerate (requires NumPy)"
+        )
+        grid3.addWidget(self.subsAutoSync, 3, 1, 1, 3)
+        self.subsAudioSync = QCheckBox("Sync subtitles to audio")
+        self.subsAudioSync.setChecked(self.settings.get("subs_audio_sync", True))
+        self.subsAudioSync.setToolTip(
+            "Set the subtitle delay automatically from the speech in the audio when a local file is opened (requires NumPy and ffmpeg)"
+        )
+        grid3.addWidget(self.subsAudioSync, 4, 1, 1, 3)
         subsGroup.setLayout(grid3)
         grid.addWidget(subsGroup, 3, 0, 1, 5)
 
@@ -1565,11 +2674,20 @@ class MainWindow(QDialog):
         self.audio_ext.setText(self.settings["audio_ext"])
         self.imageWidth.setValue(self.settings["image_width"])
         self.imageHeight.setValue(self.settings["image_height"])
+        self.cacheDecodedAudio.setChecked(
+            self.settings.get("cache_decoded_audio", True)
+        )
+        self.warnRepeatedLines.setChecked(
+            self.settings.get("warn_repeated_lines", False)
+        )
+        self.liveScreenshots.setChecked(self.settings.get("live_screenshots", True))
         self.videoWidth.setValue(self.settings["video_width"])
         self.videoHeight.setValue(self.settings["video_height"])
         self.avDelay.setValue(self.settings["av_delay"])
+        self.fastVideoClips.setChecked(self.settings.get("fast_video_clips", False))
         self.padStart.setValue(self.settings["pad_start"])
         self.padEnd.setValue(self.settings["pad_end"])
+        self.snapToSilence.setChecked(self.settings.get("snap_to_silence", True))
         self.subsTargetLang.setCurrentIndex(
             self.subsTargetLang.findText(self.settings["subs_target_language"])
         )
@@ -1578,6 +2696,16 @@ class MainWindow(QDialog):
         )
         self.subsTargetLC.setText(self.settings["subs_target_language_code"])
         self.subsNativeLC.setText(self.settings["subs_native_language_code"])
+        self.subsSecondNativeLang.setCurrentIndex(
+            self.subsSecondNativeLang.findText(
+                self.settings.get("subs_second_native_language", "")
+            )
+        )
+        self.subsSecondNativeLC.setText(
+            self.settings.get("subs_second_native_language_code", "")
+        )
+        self.subsAutoSync.setChecked(self.settings.get("subs_auto_sync", True))
+        self.subsAudioSync.setChecked(self.settings.get("subs_audio_sync", True))
         for i, onclick_dict in enumerate(self.onclick_dicts):
             if onclick_dict.name == self.settings.get("onclick_dict", None):
                 self.onClickDict.setCurrentIndex(i)
@@ -1619,6 +2747,50 @@ class MainWindow(QDialog):
         # FIXME: pop-up dict has nothing to do with the config manager - store it somewhere else!
         self.configManager.popupDict = dictionary
 
+    def onClearSubtitlesCache(self) -> None:
+        self.configManager.getSubtitlesCache().clear()
+        audio_cache.prune(audio_cache_dir, 0)
+        tooltip("Cache cleared.", parent=self)
+
+    def onTuneEncoders(self) -> None:
+        if not ffmpeg_executable:
+            showWarning("Tuning the encoders requires ffmpeg.", parent=self)
+            return
+        ffmpeg = ffmpeg_executable
+        # Clips are mostly cut from 1080p or 720p sources, so tune for the size
+        # a 16:9 one is scaled to
+        size = scaledSize(1920, 1080, self.videoWidth.value(), self.videoHeight.value())
+        settings = self.settings
+
+        def on_done(future: Future[Dict[str, Dict[str, str]]]) -> None:
+            try:
+                tuned = future.result()
+            except Exception as exc:
+                showWarning("Failed to tune the encoders:\n\n%s" % exc, parent=self)
+                return
+            if not tuned:
+                showWarning(
+                    "ffmpeg can't encode the test clip with libx264 or libvpx-vp9.",
+                    parent=self,
+                )
+                return
+            settings["encoder_options"] = tuned
+            tooltip(
+                "<br>".join(
+                    "%s: %s" % (video_format, mpv_options(options) or "defaults")
+                    for video_format, options in sorted(tuned.items())
+                ),
+                period=6000,
+                parent=self,
+            )
+
+        mw.taskman.with_progress(
+            lambda: tune_encoders(ffmpeg, size),
+            on_done,
+            parent=self,
+            label="Tuning encoders...",
+        )
+
     def chooseSubs(self, cb: QComboBox, cblc: QLineEdit) -> None:
         if cb.currentText() == "":
             cblc.setText("")
@@ -1631,17 +2803,30 @@ class MainWindow(QDialog):
         self.settings["use_mpv"] = self.useMPV.isChecked()
         self.settings["image_width"] = self.imageWidth.value()
         self.settings["image_height"] = self.imageHeight.value()
+        self.settings["live_screenshots"] = self.liveScreenshots.isChecked()
         self.settings["video_width"] = self.videoWidth.value()
         self.settings["video_height"] = self.videoHeight.value()
         self.settings["av_delay"] = self.avDelay.value()
+        self.settings["fast_video_clips"] = self.fastVideoClips.isChecked()
         self.settings["pad_start"] = self.padStart.value()
         self.settings["pad_end"] = self.padEnd.value()
+        self.settings["snap_to_silence"] = self.snapToSilence.isChecked()
         self.settings["audio_ext"] = self.audio_ext.text()
+        self.settings["cache_decoded_audio"] = self.cacheDecodedAudio.isChecked()
+        self.settings["warn_repeated_lines"] = self.warnRepeatedLines.isChecked()
 
         self.settings["subs_target_language"] = self.subsTargetLang.currentText()
         self.settings["subs_target_language_code"] = self.subsTargetLC.text()
         self.settings["subs_native_language"] = self.subsNativeLang.currentText()
         self.settings["subs_native_language_code"] = self.subsNativeLC.text()
+        self.settings[
+            "subs_second_native_language"
+        ] = self.subsSecondNativeLang.currentText()
+        self.settings[
+            "subs_second_native_language_code"
+        ] = self.subsSecondNativeLC.text()
+        self.settings["subs_auto_sync"] = self.subsAutoSync.isChecked()
+        self.settings["subs_audio_sync"] = self.subsAudioSync.isChecked()
         self.settings["alt_dict_keys"] = self.altDictKeys.isChecked()
 
         self.configManager.save(self.presetCombo.currentText())
@@ -1785,12 +2970,81 @@ or
             fileUrls = [formatURL(f) for f in getVideoFile()]
         if not fileUrls:
             return
-        AnkiHelper(executable, popenEnv, fileUrls, configManager)
+        players[:] = [player for player in players if not player.subsManager.closed]
+        players.append(AnkiHelper(executable, popenEnv, fileUrls, configManager))
+
+
+def createCardsForCurrentVideo() -> None:
+    for player in reversed(players):
+        if not player.subsManager.closed and player.subsManager.loaded.filePath:
+            player.createAnkiCards(-1, -1)
+            return
+    tooltip("Open a video first.")
+
 
-    mw.reset()
+def resumeMediaJobs() -> None:
+    """Finish the media that was being made for the collection's notes when Anki quit.
+
+    Notes left without media are reported once that's done.
+    """
+    media_dir = os.path.abspath(mw.col.media.dir())
+
+    def in_collection(job: MediaJob) -> bool:
+        return bool(job.outputs) and all(
+            os.path.dirname(os.path.abspath(output.path)) == media_dir
+            for output in job.outputs
+        )
+
+    resumed = media_scheduler.resume(
+        in_collection,
+        lambda ok: mw.taskman.run_on_main(lambda: reportMissingMedia(in_collection)),
+    )
+    if resumed:
+        tooltip("Finishing the media of cards added before Anki quit...")
+
+
+def reportMissingMedia(select: Callable[[MediaJob], bool]) -> None:
+    # The profile may have been closed in the meantime
+    if mw.col is None:
+        return
+    failures = [failure for failure in media_journal.failures() if select(failure.job)]
+    missing = sorted(
+        {
+            os.path.basename(output.path)
+            for failure in failures
+            for output in failure.job.outputs
+            if not os.path.exists(output.path)
+        }
+    )
+    noteIds: Sequence[NoteId] = []
+    if missing:
+        # Escaped, as names can have characters that mean something in searches
+        search = mw.col.build_search_string(
+            *[SearchNode(literal_text=name) for name in missing], joiner="OR"
+        )
+        noteIds = mw.col.find_notes(search)
+    if noteIds:
+        changes = mw.col.tags.bulk_add(noteIds, "mpv2anki::missing-media")
+        change_notifier.notify(changes.changes)
+        errors = [failure.stderr.strip() for failure in failures if failure.stderr]
+        msg = (
+            "The media of %d notes couldn't be created. "
+            "They were tagged with mpv2anki::missing-media." % len(noteIds)
+        )
+        if errors:
+            msg += "\n\nLast error:\n%s" % "\n".join(errors[-1].splitlines()[-5:])
+        showWarning(msg, parent=mw)
+    media_journal.mark_reported([failure.job_id for failure in failures])
 
 
 action = QAction("Open Video...", mw)
 action.setShortcut("Ctrl+O")
 qconnect(action.triggered, openVideoWithMPV)
 mw.form.menuTools.addAction(action)
+bulkAction = QAction("Create Cards for Current Video", mw)
+qconnect(bulkAction.triggered, createCardsForCurrentVideo)
+mw.form.menuTools.addAction(bulkAction)
+# Media still being made when the profile is closed is made in the background,
+# or the next time it's opened if Anki is closed
+addHook("unloadProfile", note_queue.flush)
+addHook("profileLoaded", resumeMediaJobs)
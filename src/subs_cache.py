@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from hashlib import sha1
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+class SubtitlesCache:
+    """Size-bounded on-disk cache of processed subtitles.
+
+    Each entry is a JSON file named after its key. Reading an entry touches it,
+    so the least recently used entries are the first to go when the cache
+    grows over its size limit. Subtitle tracks extracted from media files and
+    their audio envelopes are kept next to the entries and count towards the
+    same limit.
+    """
+
+    version = 2
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, paths: Sequence[str], options: Dict[str, Any]) -> Optional[str]:
+        """Build a key from the identity of the subtitle files and the processing options.
+
+        Returns None if any of the files can't be accessed.
+        """
+        files = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            files.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+        blob = json.dumps([self.version, files, options], sort_keys=True)
+        return sha1(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, ext: str = ".json") -> str:
+        return os.path.join(self.directory, key + ext)
+
+    def track_path(self, key: str) -> str:
+        """Return where to keep an extracted SRT track."""
+        return self._path(key, ".srt")
+
+    def envelope_path(self, key: str) -> str:
+        """Return where to keep the audio envelope of a media file."""
+        return self._path(key, ".npy")
+
+    def owns(self, path: str) -> bool:
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.directory)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                json.dump(entry, file, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except BaseException as exc:
+            # Temporary files aren't entries, so nothing else would remove them
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if isinstance(exc, OSError):
+                return
+            raise
+        self.evict()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for dir_entry in it:
+                    if dir_entry.name.endswith((".json", ".srt", ".npy")):
+                        stat = dir_entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+        except OSError:
+            pass
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> None:
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self) -> None:
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
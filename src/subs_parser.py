@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import codecs
+import mmap
+import os
+import re
+from typing import Iterator, Optional, Union
+
+from .cues import Cue
+
+encodings = ["utf-8", "cp1251"]
+
+# Files at least this big are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+# Size of the sample used to rule out encodings before decoding a whole file
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+_TIMESTAMP = r"(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+_CUE_TIMING_RE = re.compile(
+    r"^[ \t]*" + _TIMESTAMP + r"[ \t]*-->[ \t]*" + _TIMESTAMP + r"[^\n]*\n?",
+    re.MULTILINE,
+)
+_BLANK_LINE_RE = re.compile(r"^[ \t\r]*$", re.MULTILINE)
+# Number of the next cue when the blank line separating them is missing
+_TRAILING_INDEX_RE = re.compile(r"\n[ \t]*\d+[ \t\r]*$")
+# HTML-like tags of SRT/WebVTT and override blocks of ASS
+_TAG_RE = re.compile(r"<[^>]+>|\{\\[^}]*\}")
+# A dash starting the text or a word after a non-word character
+_DASH_RE = re.compile(r"^-|(?<=\W)-(?=\w)")
+
+
+def _space_dash(match: re.Match) -> str:
+    return "- " if match.start() == 0 else " - "
+
+
+def clean_text(text: str) -> str:
+    """Strip formatting from subtitle text and put it on a single line."""
+    # Most lines have nothing to strip, so skip the regexes when possible
+    if "\\N" in text:
+        text = text.replace("\\N", "\n")
+    if "<" in text or "{" in text:
+        text = _TAG_RE.sub("", text)
+    if "-" in text:
+        text = _DASH_RE.sub(_space_dash, text)
+    return " ".join(text.split())
+
+
+def decode(data: Union[bytes, mmap.mmap]) -> Optional[str]:
+    """Decode subtitles with the first encoding that fits, or return None."""
+    with memoryview(data) as view:
+        start = len(codecs.BOM_UTF8) if bytes(view[:3]) == codecs.BOM_UTF8 else 0
+        with view[start:] as content:
+            sample = bytes(content[:ENCODING_SAMPLE_SIZE])
+            for encoding in encodings:
+                try:
+                    decoder = codecs.getincrementaldecoder(encoding)()
+                    decoder.decode(sample, final=False)
+                    return str(content, encoding)
+                except UnicodeDecodeError:
+                    pass
+    return None
+
+
+def load_text(path: str) -> Optional[str]:
+    """Read and decode a subtitle file with a single read."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return ""
+        if size < MMAP_THRESHOLD:
+            return decode(file.read())
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return decode(data)
+
+
+def _seconds(hours: Optional[str], mins: str, secs: str, fraction: str) -> float:
+    return (
+        int(hours or 0) * 3600
+        + int(mins) * 60
+        + int(secs)
+        + int(fraction) / 10 ** len(fraction)
+    )
+
+
+def iter_cues(content: str) -> Iterator[Cue]:
+    """Parse SRT or WebVTT subtitles, yielding cleaned non-empty cues."""
+    matches = _CUE_TIMING_RE.finditer(content)
+    match = next(matches, None)
+    while match is not None:
+        next_match = next(matches, None)
+        text_end = next_match.start() if next_match else len(content)
+        blank = _BLANK_LINE_RE.search(content, match.end(), text_end)
+        # An empty match right at text_end is just where the search stopped
+        if blank and blank.start() < text_end:
+            text = content[match.end() : blank.start()]
+        else:
+            text = _TRAILING_INDEX_RE.sub("", content[match.end() : text_end])
+        text = clean_text(text)
+        if text:
+            groups = match.groups()
+            yield (_seconds(*groups[:4]), _seconds(*groups[4:]), text)
+        match = next_match
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import List, Optional, Sequence, Tuple
+
+from .cues import Cue
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Width of a sample when turning tracks into activity vectors, in seconds
+RESOLUTION = 0.2
+
+# Speed ratios between releases of the same video: 23.976 fps against 24 and
+# 25 fps (PAL speed-up), both ways
+FRAMERATE_RATIOS = sorted(
+    {
+        1.0,
+        *(
+            a / b
+            for a in (24000 / 1001, 24.0, 25.0)
+            for b in (24000 / 1001, 24.0, 25.0)
+            if a != b
+        ),
+    }
+)
+
+# Fewer cues than this don't say enough about the timing of a track
+MIN_CUES = 20
+
+# How much better the correlation of the retimed track has to be to be used
+MIN_IMPROVEMENT = 1.1
+
+
+def is_available() -> bool:
+    return np is not None
+
+
+def activity(
+    starts: "np.ndarray",
+    ends: "np.ndarray",
+    length: int,
+    resolution: float = RESOLUTION,
+) -> "np.ndarray":
+    """Rasterize cues into a vector that's 1 wherever any cue is shown."""
+    first = np.clip((starts / resolution).astype(np.int64), 0, length)
+    last = np.clip((ends / resolution).astype(np.int64), 0, length)
+    edges = np.zeros(length + 1, dtype=np.int32)
+    np.add.at(edges, first, 1)
+    np.add.at(edges, last, -1)
+    return (np.cumsum(edges[:-1]) > 0).astype(np.float32)
+
+
+def peak(corr: "np.ndarray") -> Tuple[float, float]:
+    """Return the position of the maximum with sub-sample precision, and its value."""
+    pos = int(np.argmax(corr))
+    value = float(corr[pos])
+    if 0 < pos < len(corr) - 1:
+        left, right = float(corr[pos - 1]), float(corr[pos + 1])
+        denominator = left - 2 * value + right
+        if denominator < 0:
+            return pos + 0.5 * (left - right) / denominator, value
+    return float(pos), value
+
+
+def estimate_retiming(
+    subs: Sequence[Cue], track: Sequence[Cue]
+) -> Optional[Tuple[float, float]]:
+    """Estimate how to retime `track` to line it up with `subs`.
+
+    Both tracks are rasterized and cross-correlated with FFTs once per
+    candidate framerate ratio. Returns the (scale, offset) that maps a time t in
+    `track` to t * scale + offset, or None if the track is best left as it is.
+    """
+    if np is None or min(len(subs), len(track)) < MIN_CUES:
+        return None
+    subs_times = np.array([(cue[0], cue[1]) for cue in subs], dtype=np.float64)
+    track_times = np.array([(cue[0], cue[1]) for cue in track], dtype=np.float64)
+    end = max(subs_times[:, 1].max(), track_times[:, 1].max() * max(FRAMERATE_RATIOS))
+    length = int(end / RESOLUTION) + 1
+    size = 1 << (2 * length - 1).bit_length()
+
+    target = activity(subs_times[:, 0], subs_times[:, 1], length)
+    target_norm = float(np.sqrt(target.sum()))
+    if target_norm == 0:
+        return None
+    target_fft = np.fft.rfft(target, size)
+
+    best: Optional[Tuple[float, float]] = None
+    best_score = 0.0
+    identity_score = 0.0
+    for scale in FRAMERATE_RATIOS:
+        scaled = activity(track_times[:, 0] * scale, track_times[:, 1] * scale, length)
+        norm = float(np.sqrt(scaled.sum()))
+        if norm == 0:
+            continue
+        # corr[k] is the overlap with the track shifted by k samples
+        corr = np.fft.irfft(target_fft * np.conj(np.fft.rfft(scaled, size)), size)
+        corr /= target_norm * norm
+        if scale == 1.0:
+            identity_score = float(corr[0])
+        lag, score = peak(corr)
+        if lag > size / 2:
+            lag -= size
+        if best is None or score > best_score:
+            best = (scale, lag * RESOLUTION)
+            best_score = score
+
+    if best is None or best_score < identity_score * MIN_IMPROVEMENT:
+        return None
+    return best
+
+
+def retime(track: Sequence[Cue], scale: float, offset: float) -> List[Cue]:
+    return [
+        (start * scale + offset, end * scale + offset, text)
+        for start, end, text in track
+    ]
+
+
+def sync_track(subs: Sequence[Cue], track: Sequence[Cue]) -> List[Cue]:
+    """Return `track` corrected for any constant offset and framerate drift against `subs`."""
+    retiming = estimate_retiming(subs, track)
+    if retiming is None:
+        return list(track)
+    return retime(track, *retiming)
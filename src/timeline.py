@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Optional, Sequence
+
+
+class SubtitleTimeline:
+    """Sorted index over subtitle cues answering time queries in O(log n).
+
+    Cue times are stored as parsed. The subtitle delay is applied to the queried
+    time instead, so the index never needs rebuilding when subtitles are shifted.
+    Returned ids are indexes into the columns the index was built from.
+    """
+
+    def __init__(
+        self, starts: Sequence[float] = (), ends: Sequence[float] = ()
+    ) -> None:
+        by_start = sorted(range(len(starts)), key=lambda i: (starts[i], i))
+        self._start_ids = array("I", by_start)
+        self._starts = array("d", (starts[i] for i in by_start))
+        self._ends = array("d", (ends[i] for i in by_start))
+        # Running maximum of the end times in start order. It never decreases,
+        # so bisecting it skips all cues that are over before a given time,
+        # including when long cues overlap shorter ones.
+        self._max_ends = array("d", accumulate(self._ends, max))
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def at(self, time: float, delay: float = 0.0) -> List[int]:
+        """Return the ids of all cues shown at `time`, in ascending order."""
+        time -= delay
+        first = bisect_left(self._max_ends, time)
+        last = bisect_right(self._starts, time)
+        return sorted(
+            self._start_ids[pos]
+            for pos in range(first, last)
+            if self._ends[pos] >= time
+        )
+
+    def find(self, time: float, delay: float = 0.0) -> Optional[int]:
+        """Return the id of the first cue shown at `time`, if any."""
+        ids = self.at(time, delay)
+        return ids[0] if ids else None
+
+    def overlapping(self, start: float, end: float, delay: float = 0.0) -> List[int]:
+        """Return the ids of all cues overlapping the open range (start, end)."""
+        start -= delay
+        end -= delay
+        first = bisect_right(self._max_ends, start)
+        last = bisect_left(self._starts, end)
+        return sorted(
+            self._start_ids[pos]
+            for pos in range(first, last)
+            if self._ends[pos] > start
+        )
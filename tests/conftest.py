@@ -0,0 +1,10 @@
+import os
+import sys
+import types
+
+# The add-on's package needs a running Anki to be imported, so the modules
+# that don't are imported from a bare package instead.
+if "src" not in sys.modules:
+    src = types.ModuleType("src")
+    src.__path__ = [os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")]
+    sys.modules["src"] = src
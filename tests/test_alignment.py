@@ -0,0 +1,119 @@
+import random
+from typing import List, Tuple
+
+import pytest
+
+from src.alignment import align_subtitles
+from src.cues import Cue
+
+
+def sync_subtitles(
+    subs: List[Cue], translations: List[Cue]
+) -> Tuple[List[Cue], List[Cue]]:
+    """The quadratic pairing that align_subtitles() replaced, as it was."""
+    subs = list(subs)
+    paired: List[Tuple[List, List, List]] = [([], [], []) for _ in subs]
+    for tr_start, tr_end, tr_text in translations:
+        for idx, (sub_start, sub_end, _) in enumerate(subs):
+            if sub_start < tr_end and sub_end > tr_start:
+                start = max(sub_start, tr_start)
+                end = min(sub_end, tr_end)
+                if (end - start) / (tr_end - tr_start) > 0.25:
+                    paired[idx][0].append(tr_start)
+                    paired[idx][1].append(tr_end)
+                    paired[idx][2].append(tr_text)
+                    break
+
+    translations = []
+    for idx, (starts, ends, texts) in enumerate(paired):
+        if not texts:
+            translations.append((subs[idx][0], subs[idx][1], ""))
+        else:
+            translations.append((starts[0], ends[-1], " ".join(texts)))
+
+    idx = 0
+    while idx < len(subs) and len(subs) > 1:
+        if translations[idx][2] != "":
+            idx += 1
+            continue
+        sub_start, sub_end = subs[idx][0], subs[idx][1]
+        prev_tr_end = translations[idx - 1][1] if idx > 0 else 0.0
+        next_tr_start = translations[idx + 1][0] if idx < len(subs) - 1 else 0.0
+        if idx == len(subs) - 1 or (sub_end <= next_tr_start and idx > 0):
+            merge_back = True
+        elif sub_start >= next_tr_start or sub_start >= prev_tr_end:
+            merge_back = False
+        else:
+            merge_back = (prev_tr_end - sub_start) > (
+                sub_end - next_tr_start
+            ) and idx > 0
+        if merge_back:
+            subs[idx - 1] = (
+                subs[idx - 1][0],
+                subs[idx][1],
+                subs[idx - 1][2] + " " + subs[idx][2],
+            )
+        else:
+            subs[idx + 1] = (
+                subs[idx][0],
+                subs[idx + 1][1],
+                subs[idx][2] + " " + subs[idx + 1][2],
+            )
+        del subs[idx]
+        del translations[idx]
+    return subs, translations
+
+
+def random_track(rng: random.Random, name: str, count: int) -> List[Cue]:
+    cues = []
+    time = rng.uniform(0, 5)
+    for idx in range(count):
+        # Gaps, overlaps and cues out of order, like real subtitle files
+        time += rng.uniform(-1.5, 4)
+        length = rng.uniform(0.2, 6)
+        cues.append((round(time, 3), round(time + length, 3), "%s%d" % (name, idx)))
+    if rng.random() < 0.3:
+        rng.shuffle(cues)
+    return cues
+
+
+FIXTURES = [
+    # One translation per line
+    (
+        [(1.0, 2.0, "a"), (3.0, 4.0, "b"), (5.0, 6.0, "c")],
+        [(1.1, 2.1, "A"), (2.9, 4.0, "B"), (5.0, 5.9, "C")],
+    ),
+    # A translation split over two lines, and two lines in one translation
+    (
+        [(1.0, 2.0, "a"), (2.0, 3.0, "b"), (4.0, 6.0, "c")],
+        [(1.0, 3.0, "AB"), (4.0, 5.0, "C1"), (5.0, 6.0, "C2")],
+    ),
+    # Lines without a translation at the start, in the middle and at the end
+    (
+        [
+            (0.0, 1.0, "a"),
+            (2.0, 3.0, "b"),
+            (3.5, 4.0, "c"),
+            (5.0, 6.0, "d"),
+            (8.0, 9.0, "e"),
+        ],
+        [(2.0, 3.0, "B"), (5.0, 6.0, "D")],
+    ),
+    # Nothing translated
+    ([(0.0, 1.0, "a"), (2.0, 3.0, "b")], [(10.0, 11.0, "X")]),
+    ([(0.0, 1.0, "a")], []),
+    ([], [(0.0, 1.0, "A")]),
+]
+
+
+@pytest.mark.parametrize("subs,translations", FIXTURES)
+def test_matches_old_pairing(subs: List[Cue], translations: List[Cue]) -> None:
+    assert align_subtitles(subs, [translations]) == sync_subtitles(subs, translations)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_old_pairing_on_random_tracks(seed: int) -> None:
+    rng = random.Random(seed)
+    subs = random_track(rng, "s", rng.randint(0, 40))
+    translations = random_track(rng, "t", rng.randint(0, 40))
+    assert align_subtitles(subs, [translations]) == sync_subtitles(subs, translations)
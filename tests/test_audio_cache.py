@@ -0,0 +1,28 @@
+import os
+import time
+from pathlib import Path
+from typing import List
+
+from src.audio_cache import STALE_TEMP_AGE, prune
+
+
+def make_files(tmp_path: Path, names: List[str], age: float = 0.0) -> None:
+    mtime = time.time() - age
+    for name in names:
+        path = tmp_path / name
+        path.write_bytes(b"\0\0")
+        os.utime(path, (mtime, mtime))
+
+
+def test_prune(tmp_path: Path) -> None:
+    make_files(tmp_path, ["old.pcm"], age=60)
+    make_files(tmp_path, ["new.pcm", "running.tmp"])
+    make_files(tmp_path, ["crashed.tmp"], age=STALE_TEMP_AGE + 60)
+    prune(str(tmp_path), 1)
+    assert sorted(os.listdir(tmp_path)) == ["new.pcm", "running.tmp"]
+
+
+def test_clear(tmp_path: Path) -> None:
+    make_files(tmp_path, ["track.pcm", "running.tmp"])
+    prune(str(tmp_path), 0)
+    assert not os.listdir(tmp_path)
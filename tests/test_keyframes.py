@@ -0,0 +1,47 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from src.keyframes import Keyframes, copy_start, probe_keyframes
+
+
+@pytest.fixture(name="ffmpeg")
+def fixture_ffmpeg() -> str:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        pytest.skip("ffmpeg isn't installed")
+    return ffmpeg
+
+
+def make_video(ffmpeg: str, path: Path, offset: float) -> str:
+    # Four seconds with a keyframe every second, starting at `offset`
+    argv = [ffmpeg, "-hide_banner", "-nostdin", "-v", "error", "-y"]
+    argv += ["-f", "lavfi", "-i", "testsrc=d=4:s=160x120:r=25"]
+    argv += ["-c:v", "mpeg4", "-g", "25", "-output_ts_offset", str(offset)]
+    subprocess.run(argv + [str(path)], check=True)
+    return str(path)
+
+
+@pytest.mark.parametrize("offset", [0.0, 10.0])
+def test_times_from_start(ffmpeg: str, tmp_path: Path, offset: float) -> None:
+    path = make_video(ffmpeg, tmp_path / "video.mkv", offset)
+    keyframes = probe_keyframes(ffmpeg, path)
+    assert keyframes is not None
+    assert keyframes.codec == "mpeg4"
+    assert keyframes.times == pytest.approx([0.0, 1.0, 2.0, 3.0])
+
+
+def test_not_a_video(ffmpeg: str, tmp_path: Path) -> None:
+    path = tmp_path / "text.mkv"
+    path.write_text("not a video")
+    assert probe_keyframes(ffmpeg, str(path)) is None
+
+
+def test_copy_start() -> None:
+    keyframes = Keyframes("h264", [0.0, 2.0, 4.0])
+    assert copy_start(keyframes, 2.5, "mp4") == 2.0
+    assert copy_start(keyframes, 4.0, "mp4") == 4.0
+    assert copy_start(keyframes, 3.5, "mp4") is None
+    assert copy_start(keyframes, 2.5, "webm") is None
@@ -0,0 +1,42 @@
+import sys
+import threading
+from typing import List
+
+from src.media_jobs import PRIORITY_AUDIO, MediaJob, MediaScheduler
+
+
+def run_batch(scheduler: MediaScheduler, jobs: List[MediaJob]) -> List[bool]:
+    results: List[bool] = []
+    done = threading.Event()
+
+    def on_done(ok: bool) -> None:
+        results.append(ok)
+        done.set()
+
+    scheduler.submit(jobs, on_done)
+    assert done.wait(10)
+    return results
+
+
+def test_batch_succeeds() -> None:
+    scheduler = MediaScheduler(max_workers=2)
+    job = MediaJob(PRIORITY_AUDIO, [sys.executable, "-c", "pass"])
+    assert run_batch(scheduler, [job, job]) == [True]
+
+
+def test_failed_command() -> None:
+    scheduler = MediaScheduler(max_workers=1)
+    job = MediaJob(PRIORITY_AUDIO, [sys.executable, "-c", "raise SystemExit(1)"])
+    assert run_batch(scheduler, [job]) == [False]
+
+
+def test_job_that_raises() -> None:
+    scheduler = MediaScheduler(max_workers=1)
+    # Jobs run one at a time while playing, so one left counted as running
+    # would keep the next from starting
+    scheduler.set_playing("player", True)
+    # Popen raises ValueError on arguments with null bytes
+    bad = MediaJob(PRIORITY_AUDIO, [sys.executable, "-c", "pass\0"])
+    good = MediaJob(PRIORITY_AUDIO, [sys.executable, "-c", "pass"])
+    assert run_batch(scheduler, [bad, good]) == [False]
+    assert run_batch(scheduler, [good]) == [True]
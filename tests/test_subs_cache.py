@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from src.subs_cache import SubtitlesCache
+
+
+def test_put_and_get(tmp_path: Path) -> None:
+    cache = SubtitlesCache(str(tmp_path), 1 << 20)
+    cache.put("key", {"subs": [[1.0, 2.0, "Hello"]]})
+    assert cache.get("key") == {"subs": [[1.0, 2.0, "Hello"]]}
+    assert cache.get("other") is None
+
+
+def test_failed_write_leaves_no_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = SubtitlesCache(str(tmp_path), 1 << 20)
+
+    def fail(*args: Any) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    cache.put("key", {"subs": []})
+    assert not os.listdir(tmp_path)
+
+
+def test_unserializable_entry_leaves_no_file(tmp_path: Path) -> None:
+    cache = SubtitlesCache(str(tmp_path), 1 << 20)
+    with pytest.raises(TypeError):
+        cache.put("key", {"subs": object()})
+    assert not os.listdir(tmp_path)
@@ -0,0 +1,189 @@
+import codecs
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, List
+
+import pytest
+
+from src import subs_parser
+from src.subs_parser import MMAP_THRESHOLD, iter_cues, load_text
+
+
+def srt_time(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    return "%02d:%02d:%02d,%03d" % (
+        millis // 3600000,
+        millis // 60000 % 60,
+        millis // 1000 % 60,
+        millis % 1000,
+    )
+
+
+def make_srt(count: int, newline: str = "\n") -> str:
+    blocks = []
+    for idx in range(count):
+        start = idx * 3.0
+        blocks.append(
+            newline.join(
+                [
+                    str(idx + 1),
+                    "%s --> %s" % (srt_time(start), srt_time(start + 2.5)),
+                    "<i>Line</i> number %d" % idx,
+                    "-second line",
+                    "",
+                    "",
+                ]
+            )
+        )
+    return "".join(blocks)
+
+
+def write(tmp_path: Path, data: bytes, name: str = "subs.srt") -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_srt() -> None:
+    content = (
+        "1\n00:00:01,000 --> 00:00:02,500\nHello\n<b>world</b>\n\n"
+        "2\n00:00:03,000 --> 00:00:04,000\n-Hi. -Bye.\n\n"
+        "3\n00:00:05,000 --> 00:00:06,000\n<i></i>\n\n"
+    )
+    assert list(iter_cues(content)) == [
+        (1.0, 2.5, "Hello world"),
+        (3.0, 4.0, "- Hi. - Bye."),
+    ]
+
+
+def test_webvtt() -> None:
+    content = (
+        "WEBVTT\n\nNOTE a comment\n\n"
+        "intro\n00:01.000 --> 00:02.000 align:start position:10%\nHello\n\n"
+        "01:00:03.5 --> 01:00:04.25\nworld\n"
+    )
+    assert list(iter_cues(content)) == [
+        (1.0, 2.0, "Hello"),
+        (3603.5, 3604.25, "world"),
+    ]
+
+
+def test_bom_and_crlf(tmp_path: Path) -> None:
+    content = "1\r\n00:00:01,000 --> 00:00:02,000\r\nHello\r\nworld\r\n\r\n"
+    path = write(tmp_path, codecs.BOM_UTF8 + content.encode("utf-8"))
+    text = load_text(path)
+    assert text is not None and not text.startswith("\ufeff")
+    assert list(iter_cues(text)) == [(1.0, 2.0, "Hello world")]
+
+
+def test_cp1251(tmp_path: Path) -> None:
+    content = "1\n00:00:01,000 --> 00:00:02,000\nПривет\n"
+    path = write(tmp_path, content.encode("cp1251"))
+    assert list(iter_cues(load_text(path) or "")) == [(1.0, 2.0, "Привет")]
+
+
+def test_undecodable(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(subs_parser, "encodings", ["utf-8"])
+    assert load_text(write(tmp_path, b"\xff\xfe\xfa")) is None
+
+
+def test_empty_file(tmp_path: Path) -> None:
+    assert load_text(write(tmp_path, b"")) == ""
+
+
+def test_malformed_timestamps() -> None:
+    content = (
+        "1\n00:00:01,000 --> 00:00:02,000\nfirst\n\n"
+        "2\n00:00:03,000 -> 00:00:04,000\nbad arrow\n\n"
+        "3\n00:00:aa,000 --> 00:00:06,000\nbad seconds\n\n"
+        "4\n00:00:07,000 --> \nno end\n\n"
+        "5\n00:00:09,000 --> 00:00:10,000\nlast\n"
+    )
+    assert list(iter_cues(content)) == [(1.0, 2.0, "first"), (9.0, 10.0, "last")]
+
+
+def test_missing_blank_line() -> None:
+    content = (
+        "1\n00:00:01,000 --> 00:00:02,000\nfirst\n"
+        "2\n00:00:03,000 --> 00:00:04,000\nsecond"
+    )
+    assert list(iter_cues(content)) == [(1.0, 2.0, "first"), (3.0, 4.0, "second")]
+
+
+class CountingFile:
+    def __init__(self, file: Any, reads: List[int]) -> None:
+        self.file = file
+        self.reads = reads
+
+    def read(self, *args: Any) -> bytes:
+        self.reads.append(1)
+        return self.file.read(*args)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.file, name)
+
+    def __enter__(self) -> "CountingFile":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.file.close()
+
+
+def counting_open(reads: List[int]) -> Callable[..., CountingFile]:
+    def _open(*args: Any, **kwargs: Any) -> CountingFile:
+        file = open(*args, **kwargs)  # pylint: disable=unspecified-encoding
+        return CountingFile(file, reads)
+
+    return _open
+
+
+@pytest.mark.parametrize("count", [10, MMAP_THRESHOLD // 40])
+def test_single_read(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, count: int
+) -> None:
+    content = make_srt(count, "\r\n")
+    path = write(tmp_path, content.encode("utf-8"))
+    reads: List[int] = []
+    monkeypatch.setattr(subs_parser, "open", counting_open(reads), raising=False)
+    assert load_text(path) == content
+    # Big files are memory-mapped instead
+    assert len(reads) == (1 if len(content) < MMAP_THRESHOLD else 0)
+    cues = list(iter_cues(content))
+    assert len(cues) == count
+    assert cues[-1] == (
+        (count - 1) * 3.0,
+        (count - 1) * 3.0 + 2.5,
+        "Line number %d - second line" % (count - 1),
+    )
+
+
+def test_same_timings_as_pysubs2(tmp_path: Path) -> None:
+    pysubs2 = pytest.importorskip("pysubs2")
+    path = write(tmp_path, make_srt(5000, "\r\n").encode("utf-8"))
+    cues = list(iter_cues(load_text(path) or ""))
+    subs = pysubs2.load(path, encoding="utf-8")
+    assert [cue[:2] for cue in cues] == [
+        (sub.start / 1000, sub.end / 1000) for sub in subs
+    ]
+
+
+# Timings depend on the machine and its load, so this only runs when asked
+@pytest.mark.skipif(
+    not os.environ.get("MPV2ANKI_BENCHMARK"), reason="set MPV2ANKI_BENCHMARK to run"
+)
+def test_faster_than_pysubs2(tmp_path: Path) -> None:
+    pysubs2 = pytest.importorskip("pysubs2")
+    path = write(tmp_path, make_srt(5000, "\r\n").encode("utf-8"))
+
+    def best_of(func: Callable[[], Any]) -> float:
+        times = []
+        for _ in range(3):
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    assert best_of(lambda: list(iter_cues(load_text(path) or ""))) < best_of(
+        lambda: pysubs2.load(path, encoding="utf-8")
+    )